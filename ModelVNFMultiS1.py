@@ -1,6 +1,13 @@
 from pyomo.environ import *
 from pyomo.opt import SolverFactory
 from pyomo.opt import SolverStatus, TerminationCondition
+from VNFUtilities import *
+from VNFResults import *
+from VNFCache import *
+from VNFGreedy import *
+from VNFBudget import *
+from VNFBounds import *
+from VNFTrace import objective_value
 import time
 
 
@@ -11,7 +18,11 @@ import os, sys
 sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
 from optmodel_utilities import *
 
-def create_solver(solver_name = 'cplex'):
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
     solver_path = get_solver_path(solver_name)
     return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')    
 
@@ -19,7 +30,13 @@ def create_solver(solver_name = 'cplex'):
 # Model
 #
 
-def VNFMultiS():
+def VNFMultiS(symmetry=False, encoding='unary'):
+    #encoding: variables of the module levels (VNFUtilities.LEVEL_ENCODINGS), 'unary' (Y[i,f,l]),
+    #'integer' (O[i,f] and the level V[i,f]) or 'binary' (O[i,f] and the bits B[i,f,b] of the level).
+    #The compact ones have 1 binary ('integer') or 1+log2(nb_m) ('binary') per node and function
+    #instead of nb_m. VNFUtilities.module_levels and level_entries give their solution in the Y layout
+    if encoding not in LEVEL_ENCODINGS:
+        raise ValueError("unknown encoding %s" % encoding)
     
     infinity = float('inf')
     
@@ -65,6 +82,9 @@ def VNFMultiS():
     
     # Arcs
     model.A=Set(within=model.N*model.N) 
+    
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
 
     #Demand parameters
     model.o = Param(model.D,within=NonNegativeIntegers)
@@ -77,7 +97,15 @@ def VNFMultiS():
     model.f=Param(model.D,model.S,within=model.F) #BA: 
     
     #Assignment and location variables
-    model.Y=Var(model.N,model.F,model.L,within=Binary)
+    if encoding == 'unary':
+        model.Y=Var(model.N,model.F,model.L,within=Binary)
+    else:
+        model.O=Var(model.N,model.F,within=Binary)
+        if encoding == 'integer':
+            model.V=Var(model.N,model.F,within=NonNegativeIntegers,bounds=lambda model,i,f: (0,model.nb_m))
+        else:
+            model.Bits=Set(initialize=lambda model: range(int(value(model.nb_m)).bit_length()))
+            model.B=Var(model.N,model.F,model.Bits,within=Binary)
     model.Z=Var(model.N,model.D,model.F,within=Binary)
     
     #Routing variables
@@ -87,9 +115,22 @@ def VNFMultiS():
     #model.Const=ConstraintList() #BA Why this?!
 
     
+    #an instance of f is installed on i, and its module level (0 if none)
+    def opened(model,i,f):
+        if encoding == 'unary':
+            return sum(model.Y[i,f,l] for l in model.L)
+        return model.O[i,f]
+
+    def level(model,i,f):
+        if encoding == 'unary':
+            return sum(l*model.Y[i,f,l] for l in model.L)
+        if encoding == 'integer':
+            return model.V[i,f]
+        return sum(2**b*model.B[i,f,b] for b in model.Bits)
+
     #objective function
     def SP(model):
-        value=sum(l*model.Y[i,f,l] for l in model.L for f in model.F for i in model.N)
+        value=sum(level(model,i,f) for f in model.F for i in model.N)
         return value
     
     model.cost = Objective(rule=SP, sense=minimize)
@@ -103,7 +144,7 @@ def VNFMultiS():
     
      # constraint 2 : a demand is assigned to a node only if a service instance is located on the node
     def D_to_S_Node(model,i,k,f):
-        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.L)
+        return model.Z[i,k,f] <= opened(model,i,f)
     
     model.Demand_Service_node = Constraint(model.N,model.D,model.F,rule= D_to_S_Node)
 
@@ -111,7 +152,7 @@ def VNFMultiS():
 
     #Constraint 3 : Order
     def routing_subpaths(model,i,k,s):
-        value=sum(model.X[i,j,k,s] for j in model.N if (i,j) in model.A)- sum(model.X[j,i,k,s] for j in model.N if (i,j) in model.A)
+        value=sum(model.X[i,j,k,s] for j in model.A_out[i])- sum(model.X[j,i,k,s] for j in model.A_in[i])
         return value == model.Z[i,k,model.f[k,s-1]]-model.Z[i,k,model.f[k,s]]
 
     model.routing_subpaths_Const=Constraint(model.N,model.D,model.nb_f_mod,rule=routing_subpaths)
@@ -127,7 +168,7 @@ def VNFMultiS():
 
     # constraint  5:   a simple path is used to route each demand
     def routing_first_subpath(model,i,k):
-        value=sum(model.X[i,j,k,1] for j in model.N if (i,j) in model.A) - sum(model.X[j,i,k,1] for j in model.N if (i,j) in model.A)
+        value=sum(model.X[i,j,k,1] for j in model.A_out[i]) - sum(model.X[j,i,k,1] for j in model.A_in[i])
 
         if i == model.o[k] :
             return value == 1-model.Z[i,k,model.f[k,1]]
@@ -138,7 +179,7 @@ def VNFMultiS():
     
     # constraint  6:   a simple path is used to route each demand
     def routing_last_subpath(model,i,k):
-        value = sum(model.X[i,j,k,model.nb_f] for j in model.N if (i,j) in model.A) - sum(model.X[j,i,k,model.nb_f] for j in model.N if (i,j) in model.A)
+        value = sum(model.X[i,j,k,model.nb_f] for j in model.A_out[i]) - sum(model.X[j,i,k,model.nb_f] for j in model.A_in[i])
         if i == model.t[k] :
             return value == model.Z[i,k,model.f[k,model.nb_f]]-1
         else :
@@ -149,14 +190,14 @@ def VNFMultiS():
 
     # constraint  7:   forbid the two paths to both enter #range(1,model.nb_f+1)
     def simple_path1(model,i,k):
-        value = sum(sum(model.X[j,i,k,s] for j in model.N if (i,j) in model.A) for s in model.S1)
+        value = sum(sum(model.X[j,i,k,s] for j in model.A_in[i]) for s in model.S1)
         return value <= 1
     
     model.simple_path1_const = Constraint(model.N,model.D,rule= simple_path1)
     
      # constraint  8:   forbid the two paths to both enter #range(1,model.nb_f+1)
     def simple_path2(model,i,k):
-        value=sum(sum(model.X[i,j,k,s] for j in model.N if (i,j) in model.A) for s in model.S1)
+        value=sum(sum(model.X[i,j,k,s] for j in model.A_out[i]) for s in model.S1)
         return value <= 1
 
     model.simple_path2_const = Constraint(model.N,model.D,rule= simple_path2)
@@ -164,50 +205,112 @@ def VNFMultiS():
     # constraint 9 :  
     def service_capacity(model,i,f):
         value=sum(model.d[k]*model.Z[i,k,f] for k in model.D)
-        return value <= model.mu*sum(l*model.Y[i,f,l] for l in model.L)
+        return value <= model.mu*level(model,i,f)
 
     model.service_capacity_const = Constraint(model.N,model.F,rule= service_capacity)
     
    # constraint  10:    limit the amount of demand served by each service instance and link the opening and assignment variables.
-    def single_level(model,i,f):
-        value=sum(model.Y[i,f,l] for l in model.L)
-        return value<= 1
+    if encoding == 'unary':
+        def single_level(model,i,f):
+            value=sum(model.Y[i,f,l] for l in model.L)
+            return value<= 1
+
+        model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+    else:
+        #the level of an installed instance is in [1,nb_m], 0 otherwise
+        def level_min(model,i,f):
+            return level(model,i,f) >= model.O[i,f]
+
+        model.level_min_const = Constraint(model.N,model.F,rule= level_min)
 
-    model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+        def level_max(model,i,f):
+            return level(model,i,f) <= model.nb_m*model.O[i,f]
+
+        model.level_max_const = Constraint(model.N,model.F,rule= level_max)
 
     #constraint 11:
     def node_capacity(model,i):
-        value=sum(model.mu*sum(l*model.Y[i,f,l] for l in model.L) for f in model.F)
+        value=sum(model.mu*level(model,i,f) for f in model.F)
         return value <= model.nu
     
     model.node_capacity_Const=Constraint(model.N,rule=node_capacity)
+
+    #Symmetry breaking (optional) : interchangeable nodes ordered by module level
+    if symmetry:
+        add_symmetry_breaking(model, level=None if encoding == 'unary' else level)
+
     return model
 
-def main():
+def SolveVNFMultiS(file, time_limit, output="abilene_s_s_l_l.npz", threads=None, budget=None, encoding='unary',
+                   lp_bound=False):
+    #Exact solve of VNFMultiS from the greedy MIP start
+    #output: solution file (VNFResults, the module levels in the Y layout whatever the encoding),
+    #threads: threads of the solver (solver default if None), encoding: see VNFMultiS
+    #budget: VNFBudget.Budget of the run (a new one of time_limit seconds if None), the solve gets
+    #the time left. Its incumbent is the best solution found (the greedy placement when it can be
+    #routed), its bound the one reported by the solver, or the capacity bound of VNFBounds (and
+    #the LP bound of the relaxation with lp_bound, useful when the solver reports no bound)
+    #Return the value of the best solution found (optimal if budget.gap is 0), None if there is none
+    budget = open_budget(budget, time_limit)
     # chosing the solver
     optsolver =  create_solver()
+    if threads is not None:
+        optsolver.options['threads'] = threads
 
     #Creating the model
-    model = VNFMultiS()
+    model = VNFMultiS(encoding=encoding)
+    names = LEVEL_VARIABLES[encoding]+('Z','X')
 
     #Load the data file (and create an instance)
-    instance = model.create_instance('abilene_s_s_l_l.dat')
+    data = load_data(model, file+".dat", 'VNFMultiS1')
+    instance = model.create_instance(data)
     starttime=time.time()
     #instance.pprint()
+    #upper bound and MIP start from the greedy placement
+    greedy = GreedyPlacement(plain_data(data), last_on_destination=True)
+    bounds = LowerBounds(plain_data(data))
+    if not bounds['feasible']:
+        print("the capacities can never serve the demands")
+        return None
+    budget.tighten(bounds['objective'])
+    if lp_bound:
+        bound = LPBound(plain_data(data), max(MIN_LIMIT, budget.remaining()))
+        budget.tighten(None if bound is None else bound['objective'])
+    print("borne inférieure", budget.bound)
+    if greedy['feasible']:
+        greedy_to_instance(greedy, instance)
+        #the placement is only the incumbent once its routing is found, otherwise a MIP start
+        routing = route_placement(plain_data(data), greedy, max(MIN_LIMIT, budget.remaining()))
+        if routing is not None:
+            print("Greedy solution found with value ", greedy['objective'])
+            load_values(instance, routing)
+            budget.offer(objective_value(instance), save_values(instance, names))
     #solving the problem
-    optsolver.options['timelimit'] = 120
-    results = optsolver.solve(instance)
-    if (results.solver.status == SolverStatus.ok) and (results.solver.termination_condition == TerminationCondition.optimal):
+    budget.limit(optsolver)
+    results = solve_warm(optsolver, instance)
+    condition = results.solver.termination_condition
+    if (results.solver.status == SolverStatus.ok) and (condition == TerminationCondition.optimal):
         objective =  getObjectiveValue(instance)
         print("Optimal solution found with value ", objective)
-        filename = open("abilene_s_s_l_l.txt",'w')
-        printObjectiveValue(instance, filename)
-        printPointFromModel(instance, filename)
-        filename.close()
-        print("le temps d'exécution est ",time.time()-starttime)
+        budget.offer(objective, save_values(instance, names))
+        budget.tighten(objective)
+    elif condition in (TerminationCondition.maxTimeLimit, TerminationCondition.feasible):
+        #the time ran out, the solution found so far (if any) is kept
+        budget.offer(objective_value(instance), save_values(instance, names))
+        budget.tighten(solver_bound(results))
     else:
-         print("Some problem occurred. Solver terminated with condition ", results.solver.termination_condition)
+         print("Some problem occurred. Solver terminated with condition ", condition)
     #printPointFromModel(instance)
+    if budget.values is None:
+        return None
+    load_values(instance, budget.values)
+    write_results(instance, output, entries={'Y': level_entries(instance)})
+    print("meilleure solution", budget.objective, "gap", budget.gap)
+    print("le temps d'exécution est ",time.time()-starttime)
+    return budget.objective
+
+def main():
+    SolveVNFMultiS("abilene_s_s_l_l", 120)
     
 if __name__ == '__main__':    
 
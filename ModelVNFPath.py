@@ -0,0 +1,366 @@
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+from pyomo.opt import SolverStatus, TerminationCondition
+from VNFUtilities import *
+from VNFResults import *
+from VNFCache import *
+import itertools
+import time
+
+
+### Auxiliary code ###
+###This part allows to have a "machine-independent" code if some conventions are respected
+
+import os, sys
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
+from optmodel_utilities import *
+
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
+    solver_path = get_solver_path(solver_name)
+    return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')
+
+#
+# Candidate paths
+#
+# A service-chain path of demand k is a path of the layered graph (nodes x chain position)
+# from (o[k],0) to (t[k],nb_f): a simple path o[k] -> t[k] of A together with the node of
+# the path where each function f[k,s] is served, in the order of the chain.
+# The candidates are the k shortest simple paths of A with every such placement, the
+# placements of the routes taken in turn so that max_paths keeps candidates on every route
+# (the placements grow as len(route)**nb_f, max_paths bounds the model).
+# All the sub-paths follow the same simple path, as imposed by simple_path1/2 in the
+# arc formulations, so each arc of the path carries d[k] once.
+# The arc formulation of VNFMultiS routes the layer nb_f in both routing_subpaths and
+# routing_last_subpath, which puts f[k,nb_f-1] and f[k,nb_f] on t[k] (see VNFGreedy).
+# VNFMultiSPath keeps the same placements, so that both formulations have the same optimum
+# when the candidates hold an optimal path. VNFHeuristPath serves every function on the
+# path: it only restricts VNFHeurist, whose middle functions are not routed.
+#
+
+MAX_PATHS = 200 #default number of candidate paths per demand
+
+def placements(route, chain, last_on_destination=False):
+    #(route, positions on the route serving chain[0], chain[1], ...) in the order of the chain
+    #last_on_destination: the last two functions of the chain on the destination (VNFMultiS)
+    free = max(len(chain)-2, 0) if last_on_destination else len(chain)
+    last = (len(route)-1,)*(len(chain)-free)
+    for placement in itertools.combinations_with_replacement(range(len(route)), free):
+        yield route, placement+last
+
+
+def interleave(iterables):
+    #items of the iterables taken in turn until all of them are exhausted
+    iterators = [iter(it) for it in iterables]
+    while iterators:
+        for it in list(iterators):
+            try:
+                yield next(it)
+            except StopIteration:
+                iterators.remove(it)
+
+
+def add_paths(model, k, max_paths, last_on_destination=False):
+    #Declare model.DP, the set of (demand, path) pairs, and fill
+    # model.path_arcs[k,p]     : arcs used by the path
+    # model.path_nodes[i,k,f]  : paths of k serving f on node i
+    # model.arc_paths[i,j]     : (k,p) pairs using the arc (i,j)
+    # model.demand_paths[k]    : paths of k
+    def build(model):
+        model.path_arcs = {}
+        model.demand_paths = {dem: [] for dem in model.D}
+        model.path_nodes = {}
+        model.arc_paths = {a: [] for a in model.A}
+        for dem in model.D:
+            #a demand larger than the link capacity can only be served on its origin
+            blocked = set(model.A) if model.d[dem] > model.uu else ()
+            chain = [model.f[dem,s] for s in model.S]
+            routes = k_shortest_paths(model.A_out, model.o[dem], model.t[dem], k, blocked)
+            candidates = interleave([placements(route, chain, last_on_destination) for route in routes])
+            for p, (route, placement) in enumerate(itertools.islice(candidates, max_paths), 1):
+                arcs = list(zip(route, route[1:]))
+                model.path_arcs[dem,p] = arcs
+                model.demand_paths[dem].append(p)
+                for a in arcs:
+                    model.arc_paths[a].append((dem,p))
+                for pos, f in zip(placement, chain):
+                    model.path_nodes.setdefault((route[pos],dem,f), []).append(p)
+
+    model.paths_build = BuildAction(rule=build)
+    model.DP = Set(dimen=2, initialize=lambda model: list(model.path_arcs))
+
+#
+# Model
+#
+
+def VNFMultiSPath(k=5, max_paths=MAX_PATHS):
+    #Path formulation of VNFMultiS: the routing variables X are replaced by one binary
+    #P[k,p] per candidate service-chain path
+
+    model = AbstractModel()
+
+    #number of services
+    model.nb_f=Param()
+
+    #Set of service type
+    model.F=Set()
+
+    #number of possible module
+    model.nb_m=Param()
+
+    # arc capacity
+    model.uu = Param()
+
+    #capacity of each module
+    model.mu =Param()
+
+    # nodes capacity
+    model.nu = Param()
+
+    #number of nodes
+    model.nb_n=Param()
+
+    #number of demand
+    model.nb_d=Param()
+
+    #Set of services
+    model.S=RangeSet(model.nb_f)
+
+    #Set of module
+    model.L=RangeSet(model.nb_m)
+
+    #Set of nodes
+    model.N=RangeSet(model.nb_n)
+
+    #Set of demands
+    model.D=RangeSet(model.nb_d)
+
+    # Arcs
+    model.A=Set(within=model.N*model.N)
+
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
+
+    #Demand parameters
+    model.o = Param(model.D,within=NonNegativeIntegers)
+    model.t = Param(model.D,within=NonNegativeIntegers)
+    model.d = Param(model.D,within=NonNegativeIntegers)
+
+    #Parameter of fixe order
+    #f is a bidimentional matrix, indexes are demand and VNF position
+    # the value is the VNF type that is in a given position for the demand
+    model.f=Param(model.D,model.S,within=model.F)
+
+    #Candidate service-chain paths
+    add_paths(model, k, max_paths, last_on_destination=True)
+
+    #Assignment and location variables
+    model.Y=Var(model.N,model.F,model.L,within=Binary)
+    model.Z=Var(model.N,model.D,model.F,within=Binary)
+
+    #Path variables
+    model.P=Var(model.DP,within=Binary)
+
+    #objective function
+    def SP(model):
+        value=sum(l*model.Y[i,f,l] for l in model.L for f in model.F for i in model.N)
+        return value
+
+    model.cost = Objective(rule=SP, sense=minimize)
+
+    # constraint 1 : each demand is routed on one path
+    def one_path(model,k):
+        if not model.demand_paths[k]:
+            return Constraint.Infeasible #no candidate path (e.g. d[k] > uu), as in the arc model
+        return sum(model.P[k,p] for p in model.demand_paths[k]) == 1
+
+    model.one_path_const = Constraint(model.D,rule= one_path)
+
+    # constraint 2 : the path gives the node serving each function (and D_to_S)
+    def path_assign(model,i,k,f):
+        return model.Z[i,k,f] == sum(model.P[k,p] for p in model.path_nodes.get((i,k,f), []))
+
+    model.path_assign_const = Constraint(model.N,model.D,model.F,rule= path_assign)
+
+    # constraint 3 : a demand is assigned to a node only if a service instance is located on the node
+    def D_to_S_Node(model,i,k,f):
+        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.L)
+
+    model.Demand_Service_node = Constraint(model.N,model.D,model.F,rule= D_to_S_Node)
+
+    # constraint 4 :  the link capacity constraints, rebuilt from the path incidence
+    def Link_Capacity(model,i,j):
+        if not model.arc_paths[i,j]:
+            return Constraint.Skip
+        value=sum(model.d[k]*model.P[k,p] for (k,p) in model.arc_paths[i,j])
+        return value <= model.uu
+
+    model.Link_capacity_const = Constraint(model.A,rule= Link_Capacity)
+
+    # constraint 5 :
+    def service_capacity(model,i,f):
+        value=sum(model.d[k]*model.Z[i,k,f] for k in model.D)
+        return value <= model.mu*sum(l*model.Y[i,f,l] for l in model.L)
+
+    model.service_capacity_const = Constraint(model.N,model.F,rule= service_capacity)
+
+    # constraint 6 : one module level per instance
+    def single_level(model,i,f):
+        value=sum(model.Y[i,f,l] for l in model.L)
+        return value<= 1
+
+    model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+
+    #constraint 7 :
+    def node_capacity(model,i):
+        value=sum(model.mu*sum(l*model.Y[i,f,l] for l in model.L) for f in model.F)
+        return value <= model.nu
+
+    model.node_capacity_Const=Constraint(model.N,rule=node_capacity)
+
+    return model
+
+
+def VNFHeuristPath(VNFix, k=5, max_paths=MAX_PATHS):
+    #Path formulation of VNFHeurist: maximise the served demands with at most VNFfix
+    #instances per function and level. A demand without path is not served (no node a needed).
+
+    model = AbstractModel()
+
+    #number of services
+    model.nb_f=Param()
+
+    #Set of service type
+    model.F=Set()
+
+    #number of possible module
+    model.nb_m=Param()
+
+    # arc capacity
+    model.uu = Param()
+
+    #capacity of each module
+    model.mu =Param()
+
+    # nodes capacity
+    model.nu = Param()
+
+    #number of nodes
+    model.nb_n=Param()
+
+    #number of demand
+    model.nb_d=Param()
+
+    #Set of services
+    model.S=RangeSet(model.nb_f)
+
+    #Set of module
+    model.L=RangeSet(model.nb_m)
+
+    #Set of nodes
+    model.N=RangeSet(model.nb_n)
+
+    #Set of demands
+    model.D=RangeSet(model.nb_d)
+
+    # Arcs
+    model.A=Set(within=model.N*model.N)
+
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
+
+    #Demand parameters
+    model.o = Param(model.D,within=NonNegativeIntegers)
+    model.t = Param(model.D,within=NonNegativeIntegers)
+    model.d = Param(model.D,within=NonNegativeIntegers)
+
+    #Parameter of fixe order
+    #f is a bidimentional matrix, indexes are demand and VNF position
+    # the value is the VNF type that is in a given position for the demand
+    model.f=Param(model.D,model.S,within=model.F)
+
+    #Candidate service-chain paths
+    add_paths(model, k, max_paths)
+
+    #Assignment and location variables
+    model.Y=Var(model.N,model.F,model.L,within=Binary)
+    model.Z=Var(model.N,model.D,model.F,within=Binary)
+
+    #Path variables
+    model.P=Var(model.DP,within=Binary)
+
+    #objective function
+    def SP(model):
+        value=sum(model.Z[i,k,f] for i in model.N for k in model.D for f in model.F)
+        return value
+
+    model.cost = Objective(rule=SP, sense=maximize)
+
+    #constraint 1 : each demand is routed on at most one path
+    def one_path(model,k):
+        if not model.demand_paths[k]:
+            return Constraint.Skip #no candidate path, the demand is not served
+        return sum(model.P[k,p] for p in model.demand_paths[k]) <= 1
+
+    model.one_path_const = Constraint(model.D,rule= one_path)
+
+    #constraint 2 : the path gives the node serving each function
+    def path_assign(model,i,k,f):
+        return model.Z[i,k,f] == sum(model.P[k,p] for p in model.path_nodes.get((i,k,f), []))
+
+    model.path_assign_const = Constraint(model.N,model.D,model.F,rule= path_assign)
+
+    #Constraint 3 :  a demand is assigned to a node only if a service instance is located on the node
+    def D_to_S_Node(model,i,k,f):
+        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.L)
+
+    model.Demand_Service_node = Constraint(model.N,model.D,model.F,rule= D_to_S_Node)
+
+    #Constraint 4 : the link capacity constraints, rebuilt from the path incidence
+    def Link_Capacity(model,i,j):
+        if not model.arc_paths[i,j]:
+            return Constraint.Skip
+        value=sum(model.d[k]*model.P[k,p] for (k,p) in model.arc_paths[i,j])
+        return value <= model.uu
+
+    model.Link_capacity_const = Constraint(model.A,rule= Link_Capacity)
+
+    #Constraint 5 : given the number of installed VNF
+    #the cap is a mutable parameter so that one instance can be solved for several caps
+    model.VNFfix=Param(initialize=VNFix,mutable=True)
+
+    def NbVNF(model,f,l):
+        value=sum(model.Y[i,f,l] for i in model.N)
+        return value <= model.VNFfix
+
+    model.NbVNF_const=Constraint(model.F,model.L,rule = NbVNF)
+
+    return model
+
+def main():
+    # chosing the solver
+    optsolver =  create_solver()
+
+    #Creating the model
+    model = VNFMultiSPath(k=5)
+
+    #Load the data file (and create an instance)
+    instance = create_instance_cached(model, 'abilene_s_s_l_l.dat', 'VNFMultiSPath')
+    starttime=time.time()
+    #solving the problem
+    optsolver.options['timelimit'] = 120
+    results = optsolver.solve(instance)
+    if (results.solver.status == SolverStatus.ok) and (results.solver.termination_condition == TerminationCondition.optimal):
+        objective =  getObjectiveValue(instance)
+        print("Optimal solution found with value ", objective)
+        write_results(instance, "abilene_s_s_l_l path.npz")
+        print("le temps d'exécution est ",time.time()-starttime)
+    else:
+         print("Some problem occurred. Solver terminated with condition ", results.solver.termination_condition)
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,504 @@
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+from pyomo.opt import SolverStatus, TerminationCondition
+from VNFUtilities import *
+from VNFResults import *
+from VNFCache import *
+from ModelVNFMultiS1 import VNFMultiS
+from collections import deque
+import time
+
+
+### Auxiliary code ###
+###This part allows to have a "machine-independent" code if some conventions are respected
+
+import os, sys
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
+from optmodel_utilities import *
+
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
+    solver_path = get_solver_path(solver_name)
+    return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')
+
+#
+# Reachability presolve
+#
+# The route of demand k is a simple path o[k] -> t[k] (simple_path1/2), so
+#  - node i can serve k only if i is reachable from o[k] and t[k] from i,
+#  - arc (i,j) can carry k only if dist(o[k],i)+1+dist(j,t[k]) <= hop_limit (no limit: finite),
+#    the limit of a demand is at least dist(o[k],t[k]) so that its shortest routes are kept,
+#  - no arc can carry k if d[k] > uu (Link_capacity_const with a binary X).
+# The variables and the rows of the other nodes and arcs are not built: they can only be 0
+# (or a useless circulation) in a solution of the full model. With a hop limit the routes
+# longer than hop_limit are cut, the model is then a restriction of the full one.
+# In the relaxations the pruned X can be fractional in the full model, the presolved
+# relaxation is tighter but still a valid bound of the integer problem.
+#
+
+def bfs_distances(neighbours, source):
+    #hop distance from source to every node reachable through neighbours
+    dist = {source: 0}
+    queue = deque([source])
+    while queue:
+        i = queue.popleft()
+        for j in neighbours[i]:
+            if j not in dist:
+                dist[j] = dist[i]+1
+                queue.append(j)
+    return dist
+
+
+def add_reachability(model, hop_limit=None, aux=False, routing=True):
+    #routing=False: no routing variables (model.XI is not declared)
+    #Fill, when the instance is built,
+    # model.R_nodes[k]     : nodes of N demand k can visit
+    # model.R_out[i,k]     : out neighbours of i usable by k (R_in[i,k]: in neighbours)
+    # model.R_arc[i,j]     : demands that can use the arc (i,j)
+    # model.R_demands[i]   : demands that can visit i
+    #aux=True adds the node a of VNFHeurist: a is linked to every node k can visit
+    def build(model):
+        from_o = {}
+        to_t = {}
+        model.R_nodes = {}
+        model.R_out = {}
+        model.R_in = {}
+        model.R_arc = {}
+        model.R_demands = {i: [] for i in model.N}
+        for k in model.D:
+            o, t = model.o[k], model.t[k]
+            if o not in from_o:
+                from_o[o] = bfs_distances(model.A_out, o)
+            if t not in to_t:
+                to_t[t] = bfs_distances(model.A_in, t)
+            dist_o, dist_t = from_o[o], to_t[t]
+            limit = float('inf') if hop_limit is None else max(hop_limit, dist_o.get(t, 0))
+            blocked = model.d[k] > model.uu
+            nodes = set([o, t])
+            if not blocked:
+                nodes.update(i for i in dist_o if i in dist_t and dist_o[i]+dist_t[i] <= limit)
+            nodes = sorted(nodes)
+            model.R_nodes[k] = nodes
+            for i in nodes:
+                model.R_demands[i].append(k)
+                model.R_out[i,k] = []
+                model.R_in[i,k] = []
+            if blocked:
+                continue
+            for i in nodes:
+                for j in model.A_out[i]:
+                    if i in dist_o and j in dist_t and dist_o[i]+1+dist_t[j] <= limit:
+                        model.R_out[i,k].append(j)
+                        model.R_in[j,k].append(i)
+                        model.R_arc.setdefault((i,j), []).append(k)
+            if aux:
+                a = model.a.value
+                model.R_out[a,k] = nodes
+                model.R_in[a,k] = nodes
+                for i in nodes:
+                    model.R_arc.setdefault((i,a), []).append(k)
+                    model.R_arc.setdefault((a,i), []).append(k)
+
+    model.reachability_build = BuildAction(rule=build)
+    #(i,k) pairs with a flow conservation row, and the kept routing variables
+    model.NK = Set(dimen=2, initialize=lambda model: [(i,k) for k in model.D for i in model.R_nodes[k]])
+    def routing_index(model):
+        index = []
+        for k in model.D:
+            arcs = [(i,j) for i in model.R_nodes[k] for j in model.R_out[i,k]]
+            if aux and model.d[k] <= model.uu:
+                a = model.a.value
+                arcs += [(i,a) for i in model.R_in[a,k]]+[(a,j) for j in model.R_out[a,k]]
+            for (i,j) in arcs:
+                for s in model.S1:
+                    index.append((i,j,k,s))
+        return index
+    if routing:
+        model.XI = Set(dimen=4, initialize=routing_index)
+
+#
+# Model
+#
+
+def VNFMultiSPresolve(hop_limit=None, levels=True, symmetry=False):
+    #VNFMultiS (ModelVNFMultiS1) built on the reachable variables only
+    #levels=True also removes the module levels l with mu*l > nu (node_capacity_Const)
+
+    model = AbstractModel()
+
+    #number of services
+    model.nb_f=Param()
+
+    #Set of service type
+    model.F=Set()
+
+    #number of possible module
+    model.nb_m=Param()
+
+    # arc capacity
+    model.uu = Param()
+
+    #capacity of each module
+    model.mu =Param()
+
+    # nodes capacity
+    model.nu = Param()
+
+    #number of nodes
+    model.nb_n=Param()
+
+    #number of demand
+    model.nb_d=Param()
+
+    #Set of services
+    model.S=RangeSet(model.nb_f)
+    model.S1=RangeSet(model.nb_f+1)
+
+    #Set of module
+    model.L=RangeSet(model.nb_m)
+
+    #Set of nodes
+    model.N=RangeSet(model.nb_n)
+
+    #Set of demands
+    model.D=RangeSet(model.nb_d)
+
+    # Arcs
+    model.A=Set(within=model.N*model.N)
+
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
+
+    #Demand parameters
+    model.o = Param(model.D,within=NonNegativeIntegers)
+    model.t = Param(model.D,within=NonNegativeIntegers)
+    model.d = Param(model.D,within=NonNegativeIntegers)
+
+    #Parameter of fixe order
+    #f is a bidimentional matrix, indexes are demand and VNF position
+    # the value is the VNF type that is in a given position for the demand
+    model.f=Param(model.D,model.S,within=model.F)
+
+    #Module levels a node can hold
+    model.LU=Set(within=model.L, initialize=lambda model: [l for l in model.L if not levels or model.mu*l <= model.nu])
+
+    #Reachable nodes and arcs of every demand
+    add_reachability(model, hop_limit)
+    model.ZI = Set(dimen=3, initialize=lambda model: [(i,k,f) for (i,k) in model.NK for f in model.F])
+
+    #Assignment and location variables
+    model.Y=Var(model.N,model.F,model.LU,within=Binary)
+    model.Z=Var(model.ZI,within=Binary)
+
+    #Routing variables
+    model.X=Var(model.XI,within=Binary)
+
+    #objective function
+    def SP(model):
+        value=sum(l*model.Y[i,f,l] for l in model.LU for f in model.F for i in model.N)
+        return value
+
+    model.cost = Objective(rule=SP, sense=minimize)
+
+    # constraint 1 : each demand to be assigned to one service
+    def D_to_S(model,k,f):
+        return sum(model.Z[i,k,f] for i in model.R_nodes[k]) == 1
+
+    model.Demand_Service = Constraint(model.D,model.F,rule= D_to_S)
+
+    # constraint 2 : a demand is assigned to a node only if a service instance is located on the node
+    def D_to_S_Node(model,i,k,f):
+        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.LU)
+
+    model.Demand_Service_node = Constraint(model.ZI,rule= D_to_S_Node)
+
+    model.nb_f_mod=RangeSet(2,model.nb_f)
+
+    #Constraint 3 : Order
+    def routing_subpaths(model,i,k,s):
+        value=sum(model.X[i,j,k,s] for j in model.R_out[i,k])- sum(model.X[j,i,k,s] for j in model.R_in[i,k])
+        return value == model.Z[i,k,model.f[k,s-1]]-model.Z[i,k,model.f[k,s]]
+
+    model.routing_subpaths_Const=Constraint(model.NK,model.nb_f_mod,rule=routing_subpaths)
+
+    # constraint 4 :  the link capacity constraints, on the arcs some demand can use
+    def Link_Capacity(model,i,j):
+        if (i,j) not in model.R_arc:
+            return Constraint.Skip
+        value=sum(sum(model.d[k]*model.X[i,j,k,s] for s in model.S1) for k in model.R_arc[i,j])
+        return value <= model.uu
+
+    model.Link_capacity_const = Constraint(model.A,rule= Link_Capacity)
+
+    # constraint  5:   a simple path is used to route each demand
+    def routing_first_subpath(model,i,k):
+        value=sum(model.X[i,j,k,1] for j in model.R_out[i,k]) - sum(model.X[j,i,k,1] for j in model.R_in[i,k])
+
+        if i == model.o[k] :
+            return value == 1-model.Z[i,k,model.f[k,1]]
+        else :
+            return value == -model.Z[i,k,model.f[k,1]]
+
+    model.routing_first_subpath_const = Constraint(model.NK,rule= routing_first_subpath)
+
+    # constraint  6:   a simple path is used to route each demand
+    def routing_last_subpath(model,i,k):
+        value = sum(model.X[i,j,k,model.nb_f] for j in model.R_out[i,k]) - sum(model.X[j,i,k,model.nb_f] for j in model.R_in[i,k])
+        if i == model.t[k] :
+            return value == model.Z[i,k,model.f[k,model.nb_f]]-1
+        else :
+            return value==model.Z[i,k,model.f[k,model.nb_f]]
+
+    model.routing_last_subpath_const = Constraint(model.NK,rule= routing_last_subpath)
+
+    # constraint  7:   forbid the two paths to both enter
+    def simple_path1(model,i,k):
+        if not model.R_in[i,k]:
+            return Constraint.Skip
+        value = sum(sum(model.X[j,i,k,s] for j in model.R_in[i,k]) for s in model.S1)
+        return value <= 1
+
+    model.simple_path1_const = Constraint(model.NK,rule= simple_path1)
+
+    # constraint  8:   forbid the two paths to both enter
+    def simple_path2(model,i,k):
+        if not model.R_out[i,k]:
+            return Constraint.Skip
+        value=sum(sum(model.X[i,j,k,s] for j in model.R_out[i,k]) for s in model.S1)
+        return value <= 1
+
+    model.simple_path2_const = Constraint(model.NK,rule= simple_path2)
+
+    # constraint 9 :
+    def service_capacity(model,i,f):
+        value=sum(model.d[k]*model.Z[i,k,f] for k in model.R_demands[i])
+        return value <= model.mu*sum(l*model.Y[i,f,l] for l in model.LU)
+
+    model.service_capacity_const = Constraint(model.N,model.F,rule= service_capacity)
+
+   # constraint  10:    limit the amount of demand served by each service instance and link the opening and assignment variables.
+    def single_level(model,i,f):
+        value=sum(model.Y[i,f,l] for l in model.LU)
+        return value<= 1
+
+    model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+
+    #constraint 11:
+    def node_capacity(model,i):
+        value=sum(model.mu*sum(l*model.Y[i,f,l] for l in model.LU) for f in model.F)
+        return value <= model.nu
+
+    model.node_capacity_Const=Constraint(model.N,rule=node_capacity)
+
+    #Symmetry breaking (optional) : interchangeable nodes ordered by module level
+    if symmetry:
+        add_symmetry_breaking(model, levels='LU')
+
+    return model
+
+
+def VNFHeuristPresolve(VNFix, relaxed=False, hop_limit=None, symmetry=False):
+    #VNFHeurist (relaxed=True: VNFHeuristR) of ModelVNFHeurist2 built on the reachable
+    #variables only. The node a stays linked to the nodes every demand can visit.
+    #There is no node capacity in VNFHeurist, all the module levels are kept.
+
+    if relaxed:
+        domain = {'within': PositiveReals, 'bounds': (0,1)}
+    else:
+        domain = {'within': Binary}
+
+    model = AbstractModel()
+
+    #number of services
+    model.nb_f=Param()
+
+    #Set of service type
+    model.F=Set()
+
+    #number of possible module
+    model.nb_m=Param()
+
+    # arc capacity
+    model.uu = Param()
+
+    #capacity of each module
+    model.mu =Param()
+
+    # nodes capacity
+    model.nu = Param()
+
+    #number of nodes
+    model.nb_n=Param()
+
+    #number of demand
+    model.nb_d=Param()
+
+    #auxiliaire node
+    model.a=Param(default=0)
+
+    #Set of services
+    model.S=RangeSet(model.nb_f)
+    model.S1=RangeSet(model.nb_f+1)
+
+    #Set of module
+    model.L=RangeSet(model.nb_m)
+
+    #Set of nodes
+    model.N=RangeSet(model.nb_n)
+
+    #Set of nodes union {a}
+    model.N_a = RangeSet(0,model.nb_n)
+
+    #Set of demands
+    model.D=RangeSet(model.nb_d)
+
+    # Arcs
+    model.A=Set(within=model.N*model.N)
+
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
+
+    #Demand parameters
+    model.o = Param(model.D,within=NonNegativeIntegers)
+    model.t = Param(model.D,within=NonNegativeIntegers)
+    model.d = Param(model.D,within=NonNegativeIntegers)
+
+    #Parameter of fixe order
+    #f is a bidimentional matrix, indexes are demand and VNF position
+    # the value is the VNF type that is in a given position for the demand
+    model.f=Param(model.D,model.S,within=model.F)
+
+    #Reachable nodes and arcs of every demand, a included
+    add_reachability(model, hop_limit, aux=True)
+    model.NK_a = Set(dimen=2, initialize=lambda model: [(i,k) for k in model.D for i in model.R_nodes[k]+[model.a.value]])
+    model.ZI = Set(dimen=3, initialize=lambda model: [(i,k,f) for (i,k) in model.NK_a for f in model.F])
+
+    #Assignment and location variables
+    model.Y=Var(model.N_a,model.F,model.L,**domain)
+    model.Z=Var(model.ZI,**domain)
+
+    #Routing variables
+    model.X=Var(model.XI,**domain)
+
+    #objective function
+    def SP(model):
+        value=sum(model.Z[i,k,f] for (i,k) in model.NK for f in model.F)
+        return value
+
+    model.cost = Objective(rule=SP, sense=maximize)
+
+    #constraint 1 : each demand to be assigned to one service
+    def D_to_S(model,k,f):
+        return sum(model.Z[i,k,f] for i in model.R_nodes[k]+[model.a.value]) == 1
+
+    model.Demand_Service = Constraint(model.D,model.F,rule= D_to_S)
+
+    #Constraint 2 :  a demand is assigned to a node only if a service instance is located on the node
+    def D_to_S_Node(model,i,k,f):
+        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.L)
+
+    model.Demand_Service_node = Constraint(model.ZI,rule= D_to_S_Node)
+
+    #Constraint 3 : the link capacity constraints, on the arcs some demand can use
+    model.AMD_used = Set(dimen=2, initialize=lambda model: sorted(model.R_arc))
+
+    def Link_Capacity(model,i,j):
+        value=sum(sum(model.d[k]*model.X[i,j,k,s] for s in model.S1) for k in model.R_arc[i,j])
+        return value <= model.uu
+
+    model.Link_capacity_const = Constraint(model.AMD_used,rule= Link_Capacity)
+
+    #Constraint 4 : a simple path is used to route each demand
+    #as in VNFHeurist, the arcs of a only count in the balance of a
+    def routing_first_subpath(model,i,k):
+        value=sum(model.X[i,j,k,1] for j in model.R_out.get((i,k), [])) - sum(model.X[j,i,k,1] for j in model.R_in.get((i,k), []))
+
+        if i == model.o[k] :
+            return value == 1-model.Z[i,k,model.f[k,1]]
+        else :
+            return value == -model.Z[i,k,model.f[k,1]]
+
+    model.routing_first_subpath_const = Constraint(model.NK_a,rule= routing_first_subpath)
+
+    #Constraint 5 : a simple path is used to route each demand
+    def routing_last_subpath(model,i,k):
+        value = sum(model.X[i,j,k,model.nb_f] for j in model.R_out.get((i,k), [])) - sum(model.X[j,i,k,model.nb_f] for j in model.R_in.get((i,k), []))
+        if i == model.t[k] :
+            return value == model.Z[i,k,model.f[k,model.nb_f]]-1
+        else :
+            return value==model.Z[i,k,model.f[k,model.nb_f]]
+
+    model.routing_last_subpath_const = Constraint(model.NK_a,rule= routing_last_subpath)
+
+    #Constraint 6 : forbid the two paths to both enter
+    def simple_path1(model,i,k):
+        if not model.R_in.get((i,k)):
+            return Constraint.Skip
+        value = sum(sum(model.X[j,i,k,s] for j in model.R_in[i,k]) for s in model.S1)
+        return value <= 1
+
+    model.simple_path1_const = Constraint(model.NK_a,rule= simple_path1)
+
+    #Constraint 7 : forbid the two paths to both enter
+    def simple_path2(model,i,k):
+        if not model.R_out[i,k]:
+            return Constraint.Skip
+        value=sum(sum(model.X[i,j,k,s] for j in model.R_out[i,k]) for s in model.S1)
+        return value <= 1
+
+    model.simple_path2_const = Constraint(model.NK,rule= simple_path2)
+
+    #Constraint 8 : given the number of installed VNF
+    #the cap is a mutable parameter so that one instance can be solved for several caps
+    model.VNFfix=Param(initialize=VNFix,mutable=True)
+
+    def NbVNF(model,f,l):
+        value=sum(model.Y[i,f,l] for i in model.N)
+        return value <= model.VNFfix
+
+    model.NbVNF_const=Constraint(model.F,model.L,rule = NbVNF)
+
+    #Constraint 9 :  using arcs incident in a for routing a demand that is not served by the VNF on a
+    def Paths2_a(model,k,f):
+        a = model.a.value
+        value=sum(sum(model.X[i,a,k,s] for i in model.R_in.get((a,k), [])) for s in model.S1)
+        return value <= model.Z[a,k,f]
+
+    model.Paths2a_const = Constraint(model.D,model.F,rule= Paths2_a)
+
+    #Symmetry breaking (optional) : interchangeable nodes ordered by module level
+    if symmetry:
+        add_symmetry_breaking(model)
+
+    return model
+
+def main():
+    # chosing the solver
+    optsolver =  create_solver()
+
+    #Load the data file and compare the full and the presolved models
+    file = 'abilene_s_s_l_l.dat'
+    for name, model in (('VNFMultiS1', VNFMultiS()), ('VNFMultiSPresolve', VNFMultiSPresolve())):
+        starttime=time.time()
+        instance = model.create_instance(load_data(model, file, name))
+        print(name, "variables", instance.nvariables(), "constraints", instance.nconstraints(),
+              "construction", time.time()-starttime)
+
+    starttime=time.time()
+    #solving the problem
+    optsolver.options['timelimit'] = 120
+    results = optsolver.solve(instance)
+    if (results.solver.status == SolverStatus.ok) and (results.solver.termination_condition == TerminationCondition.optimal):
+        objective =  getObjectiveValue(instance)
+        print("Optimal solution found with value ", objective)
+        write_results(instance, "abilene_s_s_l_l presolve.npz")
+        print("le temps d'exécution est ",time.time()-starttime)
+    else:
+         print("Some problem occurred. Solver terminated with condition ", results.solver.termination_condition)
+
+if __name__ == '__main__':
+
+    main()
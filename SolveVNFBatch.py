@@ -0,0 +1,167 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+import traceback
+
+
+### Batch runs ###
+###Every job (instance, method) runs in its own process, at most <workers> at the same time.
+###The method runs under a VNFBudget of the time limit, every solve gets the time left and the
+###gap of the best solution found is reported. A job still running after the time limit plus a
+###grace period is killed with its process group (the solver processes included).
+###Each job writes in <output>/<instance>.<method>.*:
+### .npz  : solution (VNFResults)
+### .log  : everything printed by the method
+### .jsonl: trace of the phases (heuristics only, VNFTrace)
+###and the summary of all the jobs is written in <output>/summary.csv and summary.json.
+
+METHODS = ('AFRHeurist', 'DFRHeurist', 'VNFMultiS')
+GRACE = 60 #seconds given to a job after its time limit before it is killed
+FIELDS = ('instance', 'method', 'status', 'objective', 'gap', 'time', 'output', 'error')
+
+
+def run_method(method, file, time_limit, threads, prefix, budget=None):
+    #Run one method, return the value it returns
+    #budget: VNFBudget.Budget of the run, holds the gap of the solution at the end
+    if method == 'AFRHeurist':
+        from VNFHeurist1 import AFRHeurist
+        return AFRHeurist(file, time_limit, trace=prefix+'.jsonl', output=prefix+'.npz', threads=threads, budget=budget)
+    if method == 'DFRHeurist':
+        from SolveVNFHeurist2 import DFRHeurist
+        return DFRHeurist(file, time_limit, trace=prefix+'.jsonl', output=prefix+'.npz', threads=threads, budget=budget)
+    if method == 'VNFMultiS':
+        from ModelVNFMultiS1 import SolveVNFMultiS
+        return SolveVNFMultiS(file, time_limit, output=prefix+'.npz', threads=threads, budget=budget)
+    raise ValueError("unknown method %s" % method)
+
+
+def job_worker(job, conn):
+    #Worker process: run the job, send its row of the summary on conn
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp() #the solver processes started by the job are killed with it
+    from VNFBudget import Budget
+    row = dict(job['row'])
+    start = time.time()
+    budget = Budget(job['time_limit'])
+    with open(job['prefix']+'.log', 'w') as log:
+        sys.stdout = sys.stderr = log
+        try:
+            row['objective'] = run_method(row['method'], job['file'], job['time_limit'], job['threads'], job['prefix'], budget)
+            row['status'] = 'ok' if row['objective'] is not None else 'no solution'
+            row['gap'] = budget.gap
+        except Exception as e:
+            traceback.print_exc()
+            row['status'] = 'error'
+            row['error'] = repr(e)
+    row['time'] = time.time()-start
+    conn.send(row)
+
+
+def instances(source):
+    #.dat files of a directory, or the lines of a manifest (a .dat file per line, # comments),
+    #relative paths of a manifest start from its directory. Return the paths without .dat
+    if os.path.isdir(source):
+        files = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith('.dat'))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source) as manifest:
+            files = [os.path.join(base, line.strip()) for line in manifest
+                     if line.strip() and not line.strip().startswith('#')]
+    return [f[:-4] if f.endswith('.dat') else f for f in files]
+
+
+def write_summary(rows, output):
+    with open(os.path.join(output, 'summary.csv'), 'w', newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(output, 'summary.json'), 'w') as out:
+        json.dump(rows, out, indent=1)
+
+
+def BatchRun(source, methods=('DFRHeurist',), time_limit=1200, threads=1, workers=None, output='batch'):
+    #Run every method on every instance of source (directory or manifest)
+    #workers: jobs at the same time (cpu_count//threads if None), threads: threads of each solve
+    #Return the rows of the summary
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1)//threads)
+    os.makedirs(output, exist_ok=True)
+    todo = []
+    for file in instances(source):
+        for method in methods:
+            name = os.path.basename(file)
+            row = dict((field, None) for field in FIELDS)
+            row.update(instance=name, method=method, output=os.path.join(output, '%s.%s.npz' % (name, method)))
+            todo.append({'row': row, 'file': file, 'time_limit': time_limit, 'threads': threads,
+                         'prefix': os.path.join(output, '%s.%s' % (name, method))})
+    todo.reverse()
+
+    ctx = multiprocessing.get_context()
+    running = {} #pipe -> [process, job, start]
+    rows = []
+
+    def kill(p):
+        try:
+            if os.getpgid(p.pid) == p.pid:
+                os.killpg(p.pid, signal.SIGTERM)
+            else:
+                p.terminate()
+        except (AttributeError, ProcessLookupError):
+            p.terminate()
+        p.join()
+
+    def finish(conn, row):
+        p, job, start = running.pop(conn)
+        conn.close()
+        p.join()
+        rows.append(row)
+        write_summary(rows, output) #the summary is up to date if the batch is stopped
+        print(row['instance'], row['method'], row['status'], row['objective'], "%.1fs" % (row['time'] or 0))
+
+    try:
+        while todo or running:
+            while todo and len(running) < workers:
+                job = todo.pop()
+                conn, child_conn = ctx.Pipe(duplex=False)
+                p = ctx.Process(target=job_worker, args=(job, child_conn), daemon=True)
+                p.start()
+                child_conn.close()
+                running[conn] = [p, job, time.time()]
+            timeout = max(0, min(s[2] for s in running.values())+time_limit+GRACE-time.time())
+            for conn in multiprocessing.connection.wait(list(running), timeout=timeout):
+                try:
+                    row = conn.recv()
+                except EOFError: #the worker died
+                    row = dict(running[conn][1]['row'], status='error', error='worker died')
+                finish(conn, row)
+            for conn, (p, job, start) in list(running.items()):
+                if time.time()-start > time_limit+GRACE:
+                    kill(p)
+                    finish(conn, dict(job['row'], status='timeout', time=time.time()-start))
+    finally:
+        for conn, (p, job, start) in list(running.items()):
+            kill(p)
+    write_summary(rows, output)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run VNF methods on many instances")
+    parser.add_argument('source', help="directory of .dat files or manifest (a .dat file per line)")
+    parser.add_argument('--method', action='append', choices=METHODS, help="method to run (repeatable), DFRHeurist by default")
+    parser.add_argument('--time-limit', type=float, default=1200, help="time limit of a job in seconds")
+    parser.add_argument('--threads', type=int, default=1, help="threads of each solve")
+    parser.add_argument('--workers', type=int, default=None, help="jobs at the same time")
+    parser.add_argument('--output', default='batch', help="directory of the outputs")
+    args = parser.parse_args()
+    BatchRun(args.source, args.method or ['DFRHeurist'], args.time_limit, args.threads, args.workers, args.output)
+
+if __name__ == '__main__':
+
+    main()
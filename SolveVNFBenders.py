@@ -0,0 +1,470 @@
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+from pyomo.opt import TerminationCondition
+
+from ModelVNFPresolve import add_reachability
+from VNFCache import *
+from VNFUtilities import *
+from VNFResults import *
+from VNFMatrix import build_matrix, solve_lp, solve_matrix
+import itertools
+import multiprocessing
+import numpy as np
+import scipy.sparse as sp
+import time
+
+
+### Auxiliary code ###
+###This part allows to have a "machine-independent" code if some conventions are respected
+
+import os, sys
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
+from optmodel_utilities import *
+
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
+    solver_path = get_solver_path(solver_name)
+    return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')
+
+#
+# Benders decomposition of VNFMultiS
+#
+# The objective sum(l*Y) does not depend on the routing, so the routing subproblems only
+# give feasibility cuts. The master places the instances (Y) and assigns the demands (Z)
+# with the service and node capacities. The subproblem is the routing part of VNFMultiS
+# itself with Z fixed to the master solution (see Routing subproblems).
+# The first master solution with a feasible routing is optimal.
+#
+
+def VNFMultiSMaster():
+    #Placement and assignment part of VNFMultiS, the routing is replaced by model.cuts
+    #Z only exists on the nodes the demand can reach (ModelVNFPresolve.add_reachability)
+
+    model = AbstractModel()
+
+    #number of services
+    model.nb_f=Param()
+
+    #Set of service type
+    model.F=Set()
+
+    #number of possible module
+    model.nb_m=Param()
+
+    # arc capacity
+    model.uu = Param()
+
+    #capacity of each module
+    model.mu =Param()
+
+    # nodes capacity
+    model.nu = Param()
+
+    #number of nodes
+    model.nb_n=Param()
+
+    #number of demand
+    model.nb_d=Param()
+
+    #Set of services
+    model.S=RangeSet(model.nb_f)
+    model.S1=RangeSet(model.nb_f+1)
+
+    #Set of module
+    model.L=RangeSet(model.nb_m)
+
+    #Set of nodes
+    model.N=RangeSet(model.nb_n)
+
+    #Set of demands
+    model.D=RangeSet(model.nb_d)
+
+    # Arcs
+    model.A=Set(within=model.N*model.N)
+
+    #Out/in neighbours of each node, built once from A
+    add_adjacency(model,'A','N','N')
+
+    #Demand parameters
+    model.o = Param(model.D,within=NonNegativeIntegers)
+    model.t = Param(model.D,within=NonNegativeIntegers)
+    model.d = Param(model.D,within=NonNegativeIntegers)
+
+    #Parameter of fixe order
+    #f is a bidimentional matrix, indexes are demand and VNF position
+    # the value is the VNF type that is in a given position for the demand
+    model.f=Param(model.D,model.S,within=model.F)
+
+    #Nodes every demand can reach
+    add_reachability(model, routing=False)
+    model.ZI = Set(dimen=3, initialize=lambda model: [(i,k,f) for (i,k) in model.NK for f in model.F])
+
+    #Assignment and location variables
+    model.Y=Var(model.N,model.F,model.L,within=Binary)
+    model.Z=Var(model.ZI,within=Binary)
+
+    #objective function
+    def SP(model):
+        value=sum(l*model.Y[i,f,l] for l in model.L for f in model.F for i in model.N)
+        return value
+
+    model.cost = Objective(rule=SP, sense=minimize)
+
+    # constraint 1 : each demand to be assigned to one service
+    def D_to_S(model,k,f):
+        return sum(model.Z[i,k,f] for i in model.R_nodes[k]) == 1
+
+    model.Demand_Service = Constraint(model.D,model.F,rule= D_to_S)
+
+    # constraint 2 : a demand is assigned to a node only if a service instance is located on the node
+    def D_to_S_Node(model,i,k,f):
+        return model.Z[i,k,f] <= sum(model.Y[i,f,l] for l in model.L)
+
+    model.Demand_Service_node = Constraint(model.ZI,rule= D_to_S_Node)
+
+    # constraint 3 :
+    def service_capacity(model,i,f):
+        value=sum(model.d[k]*model.Z[i,k,f] for k in model.R_demands[i])
+        return value <= model.mu*sum(l*model.Y[i,f,l] for l in model.L)
+
+    model.service_capacity_const = Constraint(model.N,model.F,rule= service_capacity)
+
+    # constraint 4 : one module level per instance
+    def single_level(model,i,f):
+        value=sum(model.Y[i,f,l] for l in model.L)
+        return value<= 1
+
+    model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+
+    #constraint 5 :
+    def node_capacity(model,i):
+        value=sum(model.mu*sum(l*model.Y[i,f,l] for l in model.L) for f in model.F)
+        return value <= model.nu
+
+    model.node_capacity_Const=Constraint(model.N,rule=node_capacity)
+
+    #constraints 6 to 9 : implied by the routing rows of VNFMultiS, they spare the first cuts
+    #a route enters and leaves every node at most once (simple_path1/2), so the functions served
+    #on a node are consecutive in the chain and the route does not come back to o[k] nor leave t[k]
+    def contiguity(model,i,k,p,q,r):
+        if not p < q < r or i == model.o[k] == model.t[k]:
+            return Constraint.Skip
+        return model.Z[i,k,model.f[k,p]]+model.Z[i,k,model.f[k,r]]-1 <= model.Z[i,k,model.f[k,q]]
+
+    model.contiguity_const = Constraint(model.NK,model.S,model.S,model.S,rule= contiguity)
+
+    def origin(model,k,s):
+        if s == 1 or model.o[k] == model.t[k]:
+            return Constraint.Skip
+        return model.Z[model.o[k],k,model.f[k,s]] <= model.Z[model.o[k],k,model.f[k,s-1]]
+
+    model.origin_const = Constraint(model.D,model.S,rule= origin)
+
+    def destination(model,k,s):
+        if s == model.nb_f or model.o[k] == model.t[k]:
+            return Constraint.Skip
+        return model.Z[model.t[k],k,model.f[k,s]] <= model.Z[model.t[k],k,model.f[k,s+1]]
+
+    model.destination_const = Constraint(model.D,model.S,rule= destination)
+
+    #layer nb_f is both the last subpath (routing_last_subpath) and the subpath from f[k,nb_f-1]
+    #to f[k,nb_f] (routing_subpaths), together they put f[k,nb_f-1] and f[k,nb_f] on t[k]
+    def last_functions(model,k,s):
+        if s < model.nb_f-1:
+            return Constraint.Skip
+        if (model.t[k],k) not in model.NK:
+            return Constraint.Infeasible
+        return model.Z[model.t[k],k,model.f[k,s]] == 1
+
+    model.last_functions_const = Constraint(model.D,model.S,rule= last_functions)
+
+    #constraint 10 : Benders feasibility cuts
+    model.cuts=ConstraintList()
+
+    return model
+
+#
+# Routing subproblems
+#
+# The subproblem holds the rows of VNFMultiS with X (routing_first_subpath, routing_subpaths,
+# routing_last_subpath, simple_path1/2, Link_capacity, as built by VNFMatrix.build_matrix) with
+# Z fixed to the master solution Zm. Its phase 1 LP (a slack per row and direction, minimize
+# the sum of the slacks) has the value v(Zm) = 0 iff the LP relaxation of the routing is
+# feasible. v is convex in Z and the duals u of the rows give its slope -u.A_Z, so
+#     v(Zm) - u.A_Z (Z - Zm) <= 0
+# is a valid cut, removing Zm when v(Zm) > 0.
+#  1. every demand alone (its rows and the link rows restricted to its X) in parallel workers:
+#     LP cut on the Z of the demand, then the routing with binary X. A demand routable in the
+#     LP but not with binary X gets a no-good cut on its assignment.
+#  2. if the routes found overload a link, all the demands together: LP cut, then the
+#     routing with binary X. When it fails, a deletion filter shrinks the demands to a set that
+#     cannot share the links (first among the demands of the overloaded links) and the no-good
+#     cut is on the assignment of this set only: the other demands only take capacity.
+#
+
+ROUTING_ROWS = ('routing_subpaths_Const', 'routing_first_subpath_const', 'routing_last_subpath_const',
+                'simple_path1_const', 'simple_path2_const', 'Link_capacity_const')
+CUT_TOLERANCE = 1e-6 #phase 1 value above which the routing LP is infeasible
+
+
+def flat(index):
+    return tuple(i for part in index for i in (part if isinstance(part, tuple) else (part,)))
+
+
+def routing_problem(data):
+    #Routing rows of VNFMultiS split into their Z and X columns
+    #row_demand / x_demand / z_demand: demand of every row (0 for the link rows) and column
+    problem = build_matrix(data, 'VNFMultiS')
+    rows, row_demand = [], []
+    for name, sets, offset, size in problem['rows']:
+        if name in ROUTING_ROWS:
+            rows.append(np.arange(offset, offset+size))
+            if name == 'Link_capacity_const':
+                row_demand.append(np.zeros(size, dtype=np.int64))
+            else: #indexed by (node, demand, ...)
+                row_demand.append(np.array(sets[1])[np.unravel_index(np.arange(size), [len(s) for s in sets])[1]])
+    rows = np.concatenate(rows)
+    A = problem['A'][rows]
+    columns = {}
+    for name, sets, offset in problem['columns']:
+        index = [flat(i) for i in itertools.product(*sets)]
+        columns[name] = (index, A[:, offset:offset+len(index)].tocsc())
+    z_index, A_Z = columns['Z']
+    x_index, A_X = columns['X']
+    return {
+        'A_Z': A_Z,
+        'A_X': A_X,
+        'lo': problem['row_lb'][rows],
+        'hi': problem['row_ub'][rows],
+        'row_demand': np.concatenate(row_demand),
+        'z_index': z_index,
+        'x_index': x_index,
+        'z_demand': np.array([i[1] for i in z_index], dtype=np.int64),
+        'x_demand': np.array([i[2] for i in x_index], dtype=np.int64),
+        'x_load': np.array([data['d'][i[2]] for i in x_index], dtype=float),
+    }
+
+
+def demand_part(sub, demands):
+    #rows, X and Z columns of the demands alone (the link rows on their X only), all if None
+    if demands is None:
+        return np.arange(len(sub['lo'])), np.arange(len(sub['x_index'])), np.arange(len(sub['z_index']))
+    return (np.flatnonzero(np.isin(sub['row_demand'], demands) | (sub['row_demand'] == 0)),
+            np.flatnonzero(np.isin(sub['x_demand'], demands)), np.flatnonzero(np.isin(sub['z_demand'], demands)))
+
+
+def phase1(sub, part, z, time_limit=None):
+    #Phase 1 LP of the part (demand_part) with the Z of its columns fixed to z
+    #Return (value, slope of the value with respect to these Z), None if the LP did not finish
+    rows, xcols, zcols = part
+    A_Z = sub['A_Z'][rows][:, zcols]
+    A_X = sub['A_X'][rows][:, xcols]
+    shift = A_Z @ z
+    m, n = A_X.shape
+    I = sp.identity(m, format='csr')
+    problem = {
+        'sense': 1,
+        'c': np.concatenate([np.zeros(n), np.ones(2*m)]),
+        'A': sp.hstack([A_X, I, -I]).tocsr(),
+        'row_lb': sub['lo'][rows]-shift,
+        'row_ub': sub['hi'][rows]-shift,
+        'lb': np.zeros(n+2*m),
+        'ub': np.concatenate([np.ones(n), np.full(2*m, np.inf)]),
+    }
+    res = solve_lp(problem, time_limit)
+    if res.x is None:
+        return None
+    return res.fun, -(A_Z.T @ res.duals)
+
+
+def integer_routing(sub, part, z, time_limit=None):
+    #Binary X of the part with the Z of its columns fixed to z (shortest routes),
+    #None if there is none, raise RuntimeError if the solver did not decide
+    rows, xcols, zcols = part
+    A_X = sub['A_X'][rows][:, xcols]
+    shift = sub['A_Z'][rows][:, zcols] @ z
+    n = A_X.shape[1]
+    res = solve_matrix({'sense': 1, 'c': np.ones(n), 'A': A_X, 'row_lb': sub['lo'][rows]-shift,
+                        'row_ub': sub['hi'][rows]-shift, 'lb': np.zeros(n), 'ub': np.ones(n),
+                        'integer': np.ones(n, dtype=bool)}, time_limit)
+    if res.x is not None:
+        return xcols[res.x > 0.5]
+    if res.status == 2:
+        return None
+    raise RuntimeError("routing subproblem ended with %s" % res.message)
+
+
+_worker = {}
+
+def routing_worker_init(sub, time_start, time_limit):
+    _worker['sub'] = sub
+    _worker['end'] = time_start+time_limit
+
+
+def route_demand(job):
+    #Worker: route demand k alone with its assignment z (values of its Z columns)
+    #Return (k, z, value, slope, X columns used): slope is None when k can be routed with binary X,
+    #the X columns are None when it cannot
+    k, z = job
+    sub = _worker['sub']
+    part = demand_part(sub, [k])
+    remaining = max(1, _worker['end']-time.time())
+    lp = phase1(sub, part, np.array(z), remaining)
+    if lp is None:
+        raise RuntimeError("routing LP of the demand %d did not finish" % k)
+    if lp[0] > CUT_TOLERANCE:
+        return k, z, lp[0], lp[1], None
+    return k, z, 0, None, integer_routing(sub, part, np.array(z), max(1, _worker['end']-time.time()))
+
+
+def route(sub, demands, z, end):
+    #X columns of a routing of the demands with binary X and Z fixed to z (all the Z columns),
+    #None if there is none
+    part = demand_part(sub, demands)
+    return integer_routing(sub, part, z[part[2]], max(1, end-time.time()))
+
+
+def conflict(sub, demands, z, end):
+    #Deletion filter: a subset of the demands (which cannot be routed together) that still
+    #cannot be routed together, as small as the time allows
+    demands = list(demands)
+    for k in list(demands):
+        trial = [l for l in demands if l != k]
+        if time.time() >= end:
+            break
+        if trial and route(sub, trial, z, end) is None:
+            demands = trial
+    return demands
+
+
+def lp_cut(instance, sub, zcols, z, value, slope):
+    #v(Zm) - u.A_Z (Z - Zm) <= 0 on the Z of the master (the others are 0)
+    terms = [(g, sub['z_index'][j]) for g, j in zip(slope, zcols) if abs(g) > 1e-9]
+    rhs = sum(g*zj for g, zj in zip(slope, z))-value
+    return sum(g*instance.Z[index] for g, index in terms if index in instance.Z) <= rhs+1e-9
+
+
+def no_good(instance, sub, zcols, z):
+    #forbid the assignment z of the Z columns zcols
+    used = [sub['z_index'][j] for j, zj in zip(zcols, z) if zj > 0.5]
+    return sum(instance.Z[index] for index in used) <= len(used)-1
+
+
+def BendersVNFMultiS(file, time_limit, workers=4, persistent=False):
+    #Return (objective, routes) of VNFMultiS, routes[k][s-1] the arcs of X[.,.,k,s],
+    #None if there is no solution or the time is over
+    time_start = time.time()
+
+    model = VNFMultiSMaster()
+    data = load_data(model, file+".dat", 'VNFMultiS')
+    instance = model.create_instance(data)
+    data = plain_data(data)
+    data['A'] = sorted(data['A'])
+    sub = routing_problem(data)
+    position = {index: j for j, index in enumerate(sub['z_index'])}
+    parts = {k: demand_part(sub, [k]) for k in range(1, data['nb_d']+1)}
+
+    optsolver = create_solver(persistent=persistent)
+    attach_instance(optsolver, instance)
+    routed = {} #(k, z) -> (value, slope, X columns), the subproblems already solved
+    pool = multiprocessing.get_context().Pool(workers, initializer=routing_worker_init, initargs=(sub, time_start, time_limit))
+    iteration = 0
+    solution = None
+
+    def add_cut(cut):
+        push_constraints(optsolver, [instance.cuts.add(cut)], added=True)
+
+    try:
+        while time.time()-time_start < time_limit:
+            iteration += 1
+            optsolver.options['timelimit'] = max(1, time_limit-(time.time()-time_start))
+            results = optsolver.solve(instance)
+            if results.solver.termination_condition != TerminationCondition.optimal:
+                print("Master problem ended with", results.solver.termination_condition)
+                break
+            z = np.zeros(len(sub['z_index']))
+            for index, var in instance.Z.items():
+                z[position[index]] = float(var.value > 0.5)
+
+            #1. every demand alone
+            assignment = {k: tuple(z[parts[k][2]]) for k in parts}
+            jobs = [(k, z_k) for k, z_k in assignment.items() if (k, z_k) not in routed]
+            for k, z_k, value, slope, used in pool.imap_unordered(route_demand, jobs):
+                routed[k, z_k] = (value, slope, used)
+            cuts = 0
+            for k, z_k in assignment.items():
+                value, slope, used = routed[k, z_k]
+                if slope is not None:
+                    add_cut(lp_cut(instance, sub, parts[k][2], z_k, value, slope))
+                elif used is None:
+                    add_cut(no_good(instance, sub, parts[k][2], z_k))
+                else:
+                    continue
+                cuts += 1
+            print("iteration", iteration, "objective", getObjectiveValue(instance), "cuts", cuts)
+            if cuts:
+                continue
+
+            #2. the link capacities
+            used = np.concatenate([routed[k, z_k][2] for k, z_k in assignment.items()])
+            arcs = {}
+            for j in used:
+                a = sub['x_index'][j][0:2]
+                arcs[a] = arcs.get(a, 0)+sub['x_load'][j]
+            overloaded = {a for a, load in arcs.items() if load > data['uu']}
+            if overloaded:
+                end = time_start+time_limit
+                part = demand_part(sub, None)
+                lp = phase1(sub, part, z, max(1, end-time.time()))
+                if lp is None:
+                    print("The routing LP did not finish")
+                    break
+                if lp[0] > CUT_TOLERANCE:
+                    add_cut(lp_cut(instance, sub, part[2], z, lp[0], lp[1]))
+                    print("routing LP cut on all the demands")
+                    continue
+                demands = sorted({sub['x_index'][j][2] for j in used if sub['x_index'][j][0:2] in overloaded})
+                if route(sub, demands, z, end) is None:
+                    demands = conflict(sub, demands, z, end)
+                else:
+                    used = route(sub, None, z, end)
+                    demands = None if used is not None else conflict(sub, list(parts), z, end)
+                if demands is not None:
+                    part = demand_part(sub, demands)
+                    add_cut(no_good(instance, sub, part[2], z[part[2]]))
+                    print("conflict cut on the demands", demands)
+                    continue
+            routes = {k: [[] for s in range(data['nb_f']+1)] for k in range(1, data['nb_d']+1)}
+            for j in used:
+                i, j2, k, s = sub['x_index'][j]
+                routes[k][s-1].append((i, j2))
+            solution = (getObjectiveValue(instance), routes)
+            break
+    except RuntimeError as e:
+        print(e)
+    finally:
+        pool.terminate()
+
+    print("le temps d'exécution", time.time()-time_start)
+    if solution is None:
+        print("No feasible solution found")
+        return None
+    #the routes are stored as the X of VNFMultiS
+    X = {(i, j, k, s): 1 for k, legs in solution[1].items() for s, leg in enumerate(legs, 1) for (i, j) in leg}
+    write_results(instance, "resultat benders.npz", entries={'X': X})
+    print("la solution est ", solution[0])
+    return solution
+
+
+def main():
+    # file
+    file = "abilene_s_s_l_l"
+    time_limit = 1200
+    BendersVNFMultiS(file,time_limit,workers=8)
+
+if __name__ == '__main__':
+
+    main()
@@ -3,6 +3,17 @@ from pyomo.opt import SolverFactory
 from pyomo.opt import SolverStatus, TerminationCondition
 
 from ModelVNFHeurist2 import *
+from ModelVNFPresolve import VNFHeuristPresolve
+from VNFCache import *
+from VNFUtilities import *
+from VNFResults import *
+from VNFGreedy import *
+from VNFBounds import HeuristBound
+from VNFLagrangian import *
+from VNFMatrix import build_matrix, set_cap, solve_lp, load_solution
+from VNFTrace import *
+from VNFBudget import *
+import numpy as np
 import time
 
 
@@ -13,81 +24,231 @@ import os, sys
 sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
 from optmodel_utilities import *
 
-def create_solver(solver_name = 'cplex'):
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
     solver_path = get_solver_path(solver_name)
     return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')    
 
 #
-def DFRHeurist(file,time_limit):
+def DFRHeurist(file,time_limit,trace=None,persistent=False,presolve=False,hop_limit=None,symmetry=False,feasibility='lp',
+               output="resultat heureustique2.npz",threads=None,cache=False,budget=None):
+    #trace: file name (or VNFTrace.Trace) receiving the JSON lines of every phase
+    #persistent: the instance stays loaded in a persistent solver, only the NbVNF rows and the
+    #domains switched by set_relaxed are sent again
+    #presolve: build only the reachable variables (ModelVNFPresolve), hop_limit implies presolve
+    #symmetry: order the module levels of interchangeable nodes (VNFUtilities.add_symmetry_breaking)
+    #feasibility: test of a cap before the integer solve, 'lp' (relaxation VNFHeuristR, the
+    #integer instance with its domains relaxed in place),
+    #'sparse' (the same relaxation as sparse arrays solved in process, VNFMatrix.solve_lp) or
+    #'lagrangian' (VNFLagrangian, no solver: the Lagrangian dual of the link and assignment rows is
+    #at least as tight as the LP relaxation of the same rows, but the subgradient steps stop early
+    #and the simple path rows are dropped, so the bound reached may be looser than the 'lp' one)
+    #output: solution file (VNFResults), threads: threads of every solve (solver default if None)
+    #cache: the results of the solves are stored (VNFCache.cached_solve), a probe of the same cap
+    #with the same solver options is answered without solving
+    #budget: VNFBudget.Budget of the run (a new one of time_limit seconds if None), every solve gets
+    #the time left and the search stops when it runs out. Its objective is the returned one, the
+    #number of instances: the incumbent is the solution serving every demand with the fewest instances
+    #found so far, its bound |F|+c when every cap up to c is proven too small (see instance_bound)
+    #Return the number of instances opened by the solution (Y set to 1, whatever their level),
+    #on the VNFMultiS fallback as well, None if there is none
+    presolve = presolve or hop_limit is not None
+    trace = open_trace(trace, heuristic='DFRHeurist', file=file)
+    budget = open_budget(budget, time_limit)
+    
     #Creation de solveur
-    optsolver =  create_solver()
+    #the relaxation and the integer model are the same instance, held by one solver
+    optsolver =  create_solver(persistent=persistent)
+    optsolver1 = optsolver
+    if threads is not None:
+        optsolver.options['threads'] = threads
+    
+    #create the instance only once, the VNF cap is a mutable parameter updated at each iteration
+    #and the 'lp' test solves it with its domains relaxed (set_relaxed)
+    relax = feasibility == 'lp'
+    with trace.phase('build', formulation='VNFHeurist', presolve=presolve, hop_limit=hop_limit) as rec:
+        if presolve:
+            model1=VNFHeuristPresolve(1, hop_limit=hop_limit, symmetry=symmetry)
+        else:
+            model1=VNFHeurist(1, symmetry=symmetry) #create model
+        data = load_data(model1,file+".dat",'VNFHeurist')
+        instance1 = model1.create_instance(data)#create
+        rec.update(model_size(instance1))
+    
+    #sparse relaxation, built once, the caps change the rhs of its NbVNF rows
+    problem = None
+    if feasibility == 'sparse':
+        with trace.phase('build', formulation='VNFHeuristR', backend='sparse') as rec:
+            problem = build_matrix(plain_data(data), 'VNFHeuristR', 1)
+            rec.update(variables=problem['A'].shape[1], constraints=problem['A'].shape[0])
     
-    #create model
-    model=VNFHeurist(1) 
+    attach_instance(optsolver1, instance1)
     
-    #create model
-    instance = model.create_instance(file+".dat")#create
+    #solve functions, memoized with cache
+    solveR = None
+    solve1 = solve_warm
+    if cache:
+        variant = ('-presolve-%s' % hop_limit if presolve else '')+('-symmetry' if symmetry else '')
+        solveR = cached_solve(file+".dat", 'VNFHeuristR'+variant)
+        solve1 = cached_solve(file+".dat", 'VNFHeurist'+variant, solve_warm)
     
     time_start = time.time()#initialisation du temps
     
     #Déclaration  les valeurs des variables
-    VNFmin = int(instance.nb_n.value/4)
-    stop =False
+    #the smallest cap serving every demand is searched by bisection in [VNFmin,VNFmax]
+    #VNFHeurist has no service capacity, VNFmin only counts the nodes on which the link
+    #capacities force an instance (VNFBounds.HeuristBound)
+    VNFmin = HeuristBound(plain_data(data))
+    VNFmax = instance1.nb_n.value
+    incumbent = None #cap and values of the last integer solution, feasible for any larger cap
+    relaxed = None #last Lagrangian solution, its multipliers start the next one
+    lp = None #last sparse relaxation and its cap
+    
+    #the greedy placement serves every demand of VNFHeurist with greedy['VNFfix'] instances per
+    #level, no need to search above this cap. The cap is only valid for VNFHeurist: the placement
+    #does not satisfy the routing rows of VNFMultiS (see VNFGreedy), so it bounds neither the
+    #VNFMultiS fallback nor SolveVNFMultiS
+    with trace.phase('greedy') as rec:
+        greedy = GreedyPlacement(plain_data(data))
+        rec.update(objective=greedy['objective'], VNFfix=greedy['VNFfix'], feasible=greedy['feasible'])
+    print("borne supérieure gloutonne", greedy['objective'], "VNFfix", greedy['VNFfix'], "realisable", greedy['feasible'])
+    if greedy['feasible']:
+        VNFmax = min(VNFmax, greedy['VNFfix'])
+    VNFmin = min(VNFmin, VNFmax)
+    stop = VNFmin >= VNFmax
+    #the incumbent holds the values of instance1 once a probe has served every demand,
+    #the greedy placement has no values, it is loaded again if it is still the incumbent at the end
+    #serving every demand takes an instance of every function, and more than c instances of one of
+    #them (on one level) when the cap c is too small
+    instance_bound = lambda VNFfix: len(instance1.F)+VNFfix
+    if greedy['feasible']:
+        budget.offer(len(greedy['level']), (VNFmax, None))
+    budget.tighten(instance_bound(VNFmin-1))
+    
+    def mip_start(VNFfix):
+        #the previous solution is still feasible for a larger cap,
+        #otherwise the greedy placement when it fits the cap, or the relaxation
+        #(repaired Lagrangian placement or rounded LP)
+        if incumbent is not None and incumbent[0] <= VNFfix:
+            load_values(instance1, incumbent[1]) #the relaxed solve replaced its values
+            return
+        if greedy['feasible'] and greedy['VNFfix'] <= VNFfix:
+            greedy_to_instance(greedy, instance1)
+        elif relaxed is not None and relaxed['VNFfix'] == VNFfix:
+            greedy_to_instance(relaxed, instance1)
+        elif lp is not None and lp[0] == VNFfix:
+            load_solution(problem, (lp[1].x >= 0.5).astype(float), instance1)
+        elif relax:
+            round_values(instance1)
     
     #la boucle pour trouver la solution
     while stop == False:
         
-        VNFfix = int((instance.nb_n.value+VNFmin)/2)#Actualiser la valeur de la VNF
+        VNFfix = int((VNFmax+VNFmin)/2)#Actualiser la valeur de la VNF
+        trace.iteration += 1
         
-        model=VNFHeuristR(VNFfix) #create model relaxer
-        instance = model.create_instance(file+".dat")#create instance
-        results = optsolver.solve(instance)# resolve problem
-        res=(getObjectiveValue(instance))/3 # objective
+        if feasibility == 'lagrangian':
+            #upper bound on the objective, the cap is rejected when it is below nb_d*|F|
+            with trace.phase('lagrangian', VNFfix=VNFfix) as rec:
+                relaxed = LagrangianPlacement(plain_data(data), VNFfix, decide=True, time_limit=budget.remaining(),
+                                              multipliers=None if relaxed is None else relaxed['multipliers'])
+                relaxed['VNFfix'] = VNFfix
+                rec.update(bound=relaxed['bound'], served=relaxed['served'], iterations=relaxed['iterations'])
+            full = instance1.nb_d.value*len(instance1.F)
+            res = instance1.nb_d.value if relaxed['bound'] >= full-1e-6 else relaxed['bound']/len(instance1.F)
+            proven = False #the bound only decides the probe, the budget keeps the bounds of the solves
+        elif feasibility == 'sparse':
+            set_cap(problem, VNFfix)
+            with trace.phase('solve', label='relaxed', backend='sparse', VNFfix=VNFfix) as rec:
+                lp = (VNFfix, solve_lp(problem, max(MIN_LIMIT, budget.remaining())))
+                rec.update(objective=None if lp[1].x is None else lp[1].fun, status=lp[1].message)
+            res = 0 if lp[1].x is None else lp[1].fun/3
+            res = instance1.nb_d.value if res >= instance1.nb_d.value-1e-6 else res
+            proven = lp[1].status in (0, 2) #optimal or infeasible, not stopped by the time limit
+        else:
+            instance1.VNFfix = VNFfix #only the rhs of NbVNF_const changes
+            push_constraints(optsolver1, instance1.NbVNF_const)
+            push_vars(optsolver1, set_relaxed(instance1, True))
+            budget.limit(optsolver1)
+            results = trace.solve(optsolver1, instance1, 'relaxed', solveR, VNFfix=VNFfix)# resolve problem
+            res=(getObjectiveValue(instance1))/3 # objective
+            proven = results.solver.termination_condition in (TerminationCondition.optimal, TerminationCondition.infeasible)
         print("l")
-        if res == instance.nb_d.value:
+        served = False
+        #the objectives are sums of floats (36.00000000000001 with a relaxation), compared with a tolerance
+        if res >= instance1.nb_d.value-1e-6:
             print("d")
             #Résolution avec le modèle sans relaxation
-            model1=VNFHeurist(VNFfix) #create model
-            instance1 = model1.create_instance(file+".dat")#create
-            results1 = optsolver.solve(instance1)# resolve problem
+            instance1.VNFfix = VNFfix
+            push_constraints(optsolver1, instance1.NbVNF_const)
+            push_vars(optsolver1, set_relaxed(instance1, False))
+            mip_start(VNFfix)
+            budget.limit(optsolver1)
+            results1 = trace.solve(optsolver1, instance1, 'integer', solve1, VNFfix=VNFfix)# resolve problem
             res1=(getObjectiveValue(instance1))/3 
+            incumbent = (VNFfix, save_values(instance1)) if results1.solver.status == SolverStatus.ok else None
             
-            if res1 == instance1.nb_d.value: # pour être sur du résultat avec le problème non relaxer
-                stop = True
+            if res1 >= instance1.nb_d.value-1e-6: # pour être sur du résultat avec le problème non relaxer
+                served = True
+            proven = results1.solver.termination_condition in (TerminationCondition.optimal, TerminationCondition.infeasible)
+        
+        if served:
+            VNFmax = VNFfix
+            budget.offer(float(np.nansum(VarBlock(instance1.Y).values())), (VNFfix, save_values(instance1)))
+        else:
+            VNFmin = VNFfix+1
+            #a cap rejected by a solve stopped by the time limit (or by the Lagrangian bound)
+            #only steers the bisection
+            if proven:
+                budget.tighten(instance_bound(VNFfix))
             
         #Si nous atteindrons les limites
-        if time.time()-time_start > time_limit or VNFfix >= instance.nb_n.value : 
+        if budget.expired():
             print("Reach the limit")
             stop = True
+        if VNFmin >= VNFmax:
+            stop = True
 
-        VNFmin = VNFfix
-
+    VNFfix = VNFmax
+    
     # Calcule de la solution
     if stop == True:
         print("solution trouver")
-        model1=VNFHeurist(VNFfix) #create model avec la VNffix actualiser
-        instance1 = model1.create_instance(file+".dat")#create model
-        results1 = optsolver.solve(instance1)# resolve problem
+        instance1.VNFfix = VNFfix #VNffix actualiser
+        push_vars(optsolver1, set_relaxed(instance1, False))
+        #the incumbent is (cap, values), values None for the greedy placement (no time was left
+        #to improve it, or it has the fewest instances)
+        if budget.values is not None and budget.values[1] is None:
+            VNFfix = budget.values[0]
+            greedy_to_instance(greedy, instance1)
+        elif budget.values is not None:
+            VNFfix = budget.values[0]
+            load_values(instance1, budget.values[1])
+        else:
+            push_constraints(optsolver1, instance1.NbVNF_const)
+            mip_start(VNFfix)
+            budget.limit(optsolver1)
+            results1 = trace.solve(optsolver1, instance1, 'integer', solve1, VNFfix=VNFfix)# resolve problem
         res1=getObjectiveValue(instance1)#Get the objective
         #Enregistrer les données dans un fichier Txt
-        filename = open("resultat heureustique2.txt",'w')
-        printObjectiveValue(instance1, filename)
-        printPointFromModel(instance1, filename)
-        filename.close()
-        a=0
-        for i in instance.N_a:
-            for f in instance.F:
-                for l in instance.L:
-                    a=a+instance.Y[i,f,l].value
+        write_results(instance1, output)
+        a=float(np.nansum(VarBlock(instance1.Y).values()))
+        if res1/3 >= instance1.nb_d.value-1e-6:
+            budget.offer(a)
         print("le temps d'exécution",time.time()-time_start)
-        return print("la solution est ",a)
+        trace.record('end', VNFfix=VNFfix, objective=a, served=res1, duration=time.time()-time_start, bound=budget.bound, gap=budget.gap)
+        print("la solution est ",a, "VNFfix", VNFfix, "gap", budget.gap)
+        return a
     else:
         #Si nous avons échoué de trouver la solution
         if time.time()-time_start < time_limit:
             print("Solution echouer")
             #Nous commencons tout d'abord une résolution normale pour prendre les noeuds que nous mettons en service
             model2 =VNFMultiS(instance1.nb_n.value)
-            instance2 = model2.create_instance(file+".dat")#create
+            instance2 = create_instance_cached(model2,file+".dat",'VNFMultiS')#create
             results2 = optsolver.solve(instance2)# resolve problem
             res2=getObjectiveValue(instance2)
             
@@ -104,19 +265,21 @@ def DFRHeurist(file,time_limit):
                             L.append(i)
                             
             #Add constraint limiting the location changes
-            instance2.limit.add(sum(1-instance2.Y[i,f,l].value for i in C for f in instance2.F.value for l in instance2.L.value)+sum(Y[i,f,l] for i in L for f in instance2.F.value for l in instance2.L.value)<=int(instance2.nb_n.value/10))
+            instance2.limit = ConstraintList()
+            instance2.limit.add(sum(1-instance2.Y[i,f,l].value for i in C for f in instance2.F.value for l in instance2.L.value)+sum(instance2.Y[i,f,l] for i in L for f in instance2.F.value for l in instance2.L.value)<=int(instance2.nb_n.value/10))
             #Résoudre le modèle en prenant en considération la contrainte
             results2 = optsolver.solve(instance2)# resolve problem
             res2=getObjectiveValue(instance2)
             #Enregistrement des résultats dans un fichier txt
-            filename = open("resultat heureustique2.txt",'w')
-            printObjectiveValue(instance2, filename)
-            printPointFromModel(instance2, filename)
-            filename.close()
+            write_results(instance2, output)
+            #the same quantity as the main path: the number of instances opened
+            a=float(np.nansum(VarBlock(instance2.Y).values()))
             print("le temps d'exécution",time.time()-time_start)
-            return print("le nombre de demande servi avec l'heuristique est ",res2)
+            print("la solution est ",a, "cout", res2)
+            return a
         
-        return print("No feasuble solution found")
+        print("No feasuble solution found")
+        return None
     
 def main():
     # file 
@@ -0,0 +1,244 @@
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+from pyomo.opt import SolverStatus, TerminationCondition
+
+from ModelVNFMultiS1 import VNFMultiS
+from VNFCache import *
+from VNFUtilities import *
+import time
+
+
+### Auxiliary code ###
+###This part allows to have a "machine-independent" code if some conventions are respected
+
+import os, sys
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
+from optmodel_utilities import *
+
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
+    solver_path = get_solver_path(solver_name)
+    return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')
+
+#
+# Online VNFMultiS
+#
+# The instance stays in memory while the demands arrive and depart. Every demand k is a block
+# demand_<k> holding its o, t, d, f, its variables Z and X and its rows of VNFMultiS, so adding
+# or removing a demand adds or deletes one block. The rows summing over the demands (link and
+# service capacities) are built again at the next solve. The values of the last solution are
+# the MIP start of the next solve, max_changes limits the number of Y it may change.
+#
+
+class OnlineVNFMultiS:
+
+    def __init__(self, file, persistent=False):
+        #file: .dat file (without extension) giving the network and the first demands
+        data = plain_data(load_data(VNFMultiS(), file+".dat", 'VNFMultiS'))
+        self.data = data
+        self.optsolver = create_solver(persistent=persistent)
+        self.demands = {} #k -> block demand_<k>
+        self.next_demand = 1
+        self.changed = True #the capacity rows have to be built again
+        self.solved = False #the values of Y are those of a solution
+
+        model = ConcreteModel()
+        model.N = RangeSet(data['nb_n'])
+        model.F = Set(initialize=sorted(data['F']))
+        model.L = RangeSet(data['nb_m'])
+        model.S = RangeSet(data['nb_f'])
+        model.S1 = RangeSet(data['nb_f']+1)
+        model.nb_f_mod = RangeSet(2, data['nb_f'])
+        model.A = Set(dimen=2, initialize=sorted(data['A']))
+        model.A_out = {i: [] for i in model.N}
+        model.A_in = {i: [] for i in model.N}
+        for (i, j) in model.A:
+            model.A_out[i].append(j)
+            model.A_in[j].append(i)
+
+        model.Y = Var(model.N, model.F, model.L, within=Binary)
+        model.cost = Objective(expr=sum(l*model.Y[i,f,l] for l in model.L for f in model.F for i in model.N), sense=minimize)
+
+        def single_level(model,i,f):
+            return sum(model.Y[i,f,l] for l in model.L) <= 1
+
+        model.single_level_const = Constraint(model.N,model.F,rule= single_level)
+
+        def node_capacity(model,i):
+            return sum(data['mu']*sum(l*model.Y[i,f,l] for l in model.L) for f in model.F) <= data['nu']
+
+        model.node_capacity_Const = Constraint(model.N,rule=node_capacity)
+        self.model = model
+        attach_instance(self.optsolver, model)
+
+        for k in range(1, data['nb_d']+1):
+            self.add_demand(data['o'][k], data['t'][k], data['d'][k], [data['f'][k, s] for s in model.S])
+
+    def add_demand(self, o, t, d, chain):
+        #chain: the functions f[k,1..nb_f], every function once (Demand_Service)
+        #Return the number k of the new demand
+        model = self.model
+        if sorted(chain) != list(model.F):
+            raise ValueError("the chain %s does not hold every function once" % (chain,))
+        k = self.next_demand
+        self.next_demand += 1
+        self._drop_capacity()
+
+        block = Block(concrete=True)
+        block.o, block.t, block.d = o, t, d
+        block.f = dict(enumerate(chain, 1))
+        block.Z = Var(model.N, model.F, within=Binary)
+        block.X = Var(model.A, model.S1, within=Binary)
+
+        #rows of VNFMultiS for the demand k
+        def D_to_S(block,f):
+            return sum(block.Z[i,f] for i in model.N) == 1
+
+        block.Demand_Service = Constraint(model.F,rule= D_to_S)
+
+        def D_to_S_Node(block,i,f):
+            return block.Z[i,f] <= sum(model.Y[i,f,l] for l in model.L)
+
+        block.Demand_Service_node = Constraint(model.N,model.F,rule= D_to_S_Node)
+
+        def flow(block,i,s):
+            return sum(block.X[i,j,s] for j in model.A_out[i])-sum(block.X[j,i,s] for j in model.A_in[i])
+
+        def routing_subpaths(block,i,s):
+            return flow(block,i,s) == block.Z[i,block.f[s-1]]-block.Z[i,block.f[s]]
+
+        block.routing_subpaths_Const = Constraint(model.N,model.nb_f_mod,rule=routing_subpaths)
+
+        def routing_first_subpath(block,i):
+            if i == o:
+                return flow(block,i,1) == 1-block.Z[i,block.f[1]]
+            else:
+                return flow(block,i,1) == -block.Z[i,block.f[1]]
+
+        block.routing_first_subpath_const = Constraint(model.N,rule= routing_first_subpath)
+
+        def routing_last_subpath(block,i):
+            nb_f = len(chain)
+            if i == t:
+                return flow(block,i,nb_f) == block.Z[i,block.f[nb_f]]-1
+            else:
+                return flow(block,i,nb_f) == block.Z[i,block.f[nb_f]]
+
+        block.routing_last_subpath_const = Constraint(model.N,rule= routing_last_subpath)
+
+        def simple_path1(block,i):
+            return sum(block.X[j,i,s] for j in model.A_in[i] for s in model.S1) <= 1
+
+        block.simple_path1_const = Constraint(model.N,rule= simple_path1)
+
+        def simple_path2(block,i):
+            return sum(block.X[i,j,s] for j in model.A_out[i] for s in model.S1) <= 1
+
+        block.simple_path2_const = Constraint(model.N,rule= simple_path2)
+
+        model.add_component('demand_%d' % k, block)
+        self.demands[k] = block
+        if is_persistent(self.optsolver):
+            self.optsolver.add_block(block)
+        return k
+
+    def remove_demand(self, k):
+        block = self.demands.pop(k)
+        self._drop_capacity()
+        if is_persistent(self.optsolver):
+            self.optsolver.remove_block(block)
+        self.model.del_component(block)
+
+    def _drop_capacity(self):
+        #delete the rows summing over the demands, built again by the next solve
+        self._drop('Link_capacity_const')
+        self._drop('service_capacity_const')
+        self.changed = True
+
+    def _drop(self, name):
+        component = self.model.component(name)
+        if component is None:
+            return
+        if is_persistent(self.optsolver):
+            for con in component.values():
+                self.optsolver.remove_constraint(con)
+        self.model.del_component(component)
+
+    def _build_capacity(self):
+        model = self.model
+        data = self.data
+        blocks = list(self.demands.values())
+
+        def Link_Capacity(model,i,j):
+            if not blocks:
+                return Constraint.Skip
+            return sum(block.d*block.X[i,j,s] for block in blocks for s in model.S1) <= data['uu']
+
+        model.Link_capacity_const = Constraint(model.A,rule= Link_Capacity)
+
+        def service_capacity(model,i,f):
+            value = sum(block.d*block.Z[i,f] for block in blocks)
+            return value <= data['mu']*sum(l*model.Y[i,f,l] for l in model.L)
+
+        model.service_capacity_const = Constraint(model.N,model.F,rule= service_capacity)
+        push_constraints(self.optsolver, model.Link_capacity_const, added=True)
+        push_constraints(self.optsolver, model.service_capacity_const, added=True)
+        self.changed = False
+
+    def solve(self, max_changes=None, time_limit=None):
+        #Solve from the current values (MIP start), at most max_changes values of Y
+        #differ from the last solution when it is given
+        model = self.model
+        if self.changed:
+            self._build_capacity()
+        self._drop('limit')
+        if max_changes is not None and self.solved:
+            opened = [index for index, var in model.Y.items() if var.value is not None and var.value > 0.5]
+            closed = [index for index, var in model.Y.items() if var.value is None or var.value <= 0.5]
+            model.limit = Constraint(expr=sum(1-model.Y[index] for index in opened)+sum(model.Y[index] for index in closed) <= max_changes)
+            push_constraints(self.optsolver, [model.limit], added=True)
+        if time_limit is not None:
+            self.optsolver.options['timelimit'] = time_limit
+        results = solve_warm(self.optsolver, model)
+        self.solved = (results.solver.status == SolverStatus.ok
+                       and results.solver.termination_condition in (TerminationCondition.optimal, TerminationCondition.feasible))
+        return results
+
+    def placement(self):
+        #{(i,f): l} module level of every open instance
+        return {(i, f): l for (i, f, l), var in self.model.Y.items() if var.value is not None and var.value > 0.5}
+
+    def assignment(self, k):
+        #{f: node serving f for the demand k}
+        return {f: i for (i, f), var in self.demands[k].Z.items() if var.value is not None and var.value > 0.5}
+
+    def route(self, k):
+        #arcs used by the demand k, one list per sub-path
+        block = self.demands[k]
+        return [[(i, j) for (i, j) in self.model.A if block.X[i,j,s].value is not None and block.X[i,j,s].value > 0.5]
+                for s in self.model.S1]
+
+
+def main():
+    # file
+    file = "abilene_s_s_l_l"
+    starttime = time.time()
+    online = OnlineVNFMultiS(file)
+    online.optsolver.options['timelimit'] = 120
+    results = online.solve()
+    print("solution initiale", getObjectiveValue(online.model), "temps", time.time()-starttime)
+
+    #one demand departs, another one arrives, at most two instances move
+    starttime = time.time()
+    online.remove_demand(1)
+    k = online.add_demand(1, 2, 5, list(online.model.F))
+    results = online.solve(max_changes=2)
+    print("demande", k, "ajoutee, solution", getObjectiveValue(online.model), results.solver.termination_condition,
+          "temps", time.time()-starttime)
+
+if __name__ == '__main__':
+
+    main()
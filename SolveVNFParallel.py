@@ -0,0 +1,189 @@
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+
+from ModelVNFHeurist2 import *
+from VNFCache import *
+from VNFUtilities import *
+from VNFResults import *
+from VNFBudget import *
+from VNFBounds import HeuristBound
+import multiprocessing
+import multiprocessing.connection
+import signal
+import time
+
+
+### Auxiliary code ###
+###This part allows to have a "machine-independent" code if some conventions are respected
+
+import os, sys
+sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
+from optmodel_utilities import *
+
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
+    solver_path = get_solver_path(solver_name)
+    return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')
+
+#
+# Parallel search of the VNF cap
+#
+
+def served_all(instance):
+    #True if every demand is served for every function
+    return abs(getObjectiveValue(instance)-instance.nb_d.value*len(instance.F)) < 1e-6
+
+
+def probe_worker(file, threads, conn, time_limit, persistent=False):
+    #Worker process: builds the instance once, then tests every VNF cap received on conn
+    #(relaxation first, as in DFRHeurist, on the same instance with its domains relaxed)
+    #time_limit: seconds left to the run, every solve gets the time left (VNFBudget.Budget)
+    budget = Budget(time_limit)
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp() #the solver processes started by the worker are killed with it
+    optsolver = create_solver(persistent=persistent)
+    optsolver.options['threads'] = threads
+    instance = create_instance_cached(VNFHeurist(1), file+".dat", 'VNFHeurist')
+    attach_instance(optsolver, instance)
+    while True:
+        VNFfix = conn.recv()
+        if VNFfix is None:
+            return
+        instance.VNFfix = VNFfix
+        push_constraints(optsolver, instance.NbVNF_const)
+        push_vars(optsolver, set_relaxed(instance, True))
+        budget.limit(optsolver)
+        optsolver.solve(instance)
+        feasible = served_all(instance)
+        if feasible:
+            push_vars(optsolver, set_relaxed(instance, False))
+            round_values(instance)
+            budget.limit(optsolver)
+            solve_warm(optsolver, instance)
+            feasible = served_all(instance)
+        conn.send((VNFfix, feasible))
+
+
+def candidates(lo, hi, k, running):
+    #at most k caps splitting [lo,hi-1] in equal parts, without the caps already probed
+    caps = []
+    for j in range(1, k+1):
+        cap = lo+int(j*(hi-lo)/(k+1))
+        if lo <= cap < hi and cap not in running and cap not in caps:
+            caps.append(cap)
+    return caps
+
+
+def ParallelDFRHeurist(file, time_limit, workers=4, threads=None, persistent=False,
+                       output="resultat heureustique2.npz"):
+    #k-ary search of the smallest VNF cap for which every demand is served
+    #workers probes run at the same time (at most threads), the threads are shared between them
+    #persistent: every worker keeps its instances loaded in persistent solvers
+    #the probes that become irrelevant (cap outside the current interval) are killed
+    #output: solution file (VNFResults)
+    #every solve, in the workers and the final one, gets the time left to the run
+    time_start = time.time()
+    budget = Budget(time_limit)
+    if threads is None:
+        threads = os.cpu_count()
+    #never more threads in total than asked: one worker per thread at most, and the
+    #remainder of threads//workers spread over the first workers
+    workers = max(1, min(workers, threads))
+    shares = [threads//workers+(w < threads % workers) for w in range(workers)]
+    data = plain_data(load_data(VNFHeurist(1), file+".dat", 'VNFHeurist'))
+    nb_n = data['nb_n']
+
+    #one pipe per worker: killing a worker never leaves a shared queue in a broken state
+    ctx = multiprocessing.get_context()
+    slots = {} #pid -> [process, pipe, cap being probed, threads]
+
+    def spawn(share):
+        conn, child_conn = ctx.Pipe()
+        p = ctx.Process(target=probe_worker, args=(file, share, child_conn, budget.remaining(), persistent), daemon=True)
+        p.start()
+        child_conn.close()
+        slots[p.pid] = [p, conn, None, share]
+
+    def kill(pid):
+        #return the threads of the worker, for the worker replacing it
+        p, conn, cap, share = slots.pop(pid)
+        conn.close()
+        try:
+            if os.getpgid(pid) == pid:
+                os.killpg(pid, signal.SIGTERM)
+            else:
+                p.terminate()
+        except (AttributeError, ProcessLookupError):
+            p.terminate()
+        p.join()
+        return share
+
+    for share in shares:
+        spawn(share)
+
+    lo = min(HeuristBound(data), nb_n) #smallest cap that can still be the answer
+    hi = nb_n #smallest cap known to serve every demand (nb_n if none)
+    found = False
+    while lo < hi:
+        running = [s[2] for s in slots.values() if s[2] is not None]
+        idle = [pid for pid, s in slots.items() if s[2] is None]
+        for pid, cap in zip(idle, candidates(lo, hi, len(slots), running)):
+            slots[pid][1].send(cap)
+            slots[pid][2] = cap
+        remaining = budget.remaining()
+        if remaining <= 0 or all(s[2] is None for s in slots.values()):
+            print("Reach the limit")
+            break
+        pipes = {s[1]: pid for pid, s in slots.items() if s[2] is not None}
+        ready = multiprocessing.connection.wait(list(pipes), timeout=remaining)
+        if not ready:
+            print("Reach the limit")
+            break
+        for conn in ready:
+            pid = pipes[conn]
+            try:
+                cap, feasible = conn.recv()
+            except EOFError: #the worker died, the cap will be probed again
+                spawn(kill(pid))
+                continue
+            slots[pid][2] = None
+            print("VNFfix", cap, "feasible" if feasible else "infeasible")
+            if feasible:
+                hi = min(hi, cap)
+                found = True
+            else:
+                lo = max(lo, cap+1)
+        for pid in [pid for pid, s in slots.items() if s[2] is not None and not lo <= s[2] < hi]:
+            spawn(kill(pid))
+
+    for pid in list(slots):
+        kill(pid)
+
+    #final solution with every thread
+    optsolver = create_solver()
+    optsolver.options['threads'] = threads
+    instance1 = create_instance_cached(VNFHeurist(1), file+".dat", 'VNFHeurist')
+    instance1.VNFfix = hi
+    budget.limit(optsolver)
+    optsolver.solve(instance1)
+    write_results(instance1, output)
+    print("le temps d'exécution",time.time()-time_start)
+    if found or served_all(instance1):
+        print("la solution est ",hi)
+        return hi
+    print("No feasible solution found")
+    return None
+
+
+def main():
+    # file
+    file = "ta1_s_s_m_l"
+    time_limit = 1200
+    ParallelDFRHeurist(file,time_limit,workers=8,threads=32)
+
+if __name__ == '__main__':
+
+    main()
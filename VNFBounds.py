@@ -0,0 +1,84 @@
+import math
+
+
+### Lower bounds for the VNF placement ###
+###Every demand k is assigned to one instance of every function f (Demand_Service), so each
+###function must serve sum(d). An instance of level l serves at most mu*l (service_capacity),
+###a node holds at most nu (node_capacity) and one level per function (single_level).
+###The bounds are valid for the capacitated problem VNFMultiS only (SolveVNFMultiS reports its
+###gap against them). VNFHeurist does not enforce mu and nu: it may serve every demand with
+###fewer instances, so they do not bound the cap searched by DFRHeurist. HeuristBound bounds
+###that cap from the link capacities instead.
+
+
+def max_level(data):
+    #highest module level an instance can use on a node
+    return min(data['nb_m'], data['nu']//data['mu'])
+
+
+def LowerBounds(data):
+    #data: plain data (VNFUtilities.plain_data)
+    #Return a dict with
+    # 'feasible'  : False if the capacities can never serve the demands
+    # 'instances' : lower bound on the number of instances of each function
+    # 'objective' : lower bound on sum(l*Y)
+    demand = sum(data['d'].values())
+    mu = data['mu']
+    lmax = max_level(data)
+    nF = len(data['F'])
+    feasible = (lmax >= 1 and max(data['d'].values(), default=0) <= mu*lmax
+                and nF*demand <= data['nb_n']*mu*(data['nu']//mu))
+    if not feasible:
+        return {'feasible': False, 'instances': None, 'objective': None}
+    #one instance serves at most mu*lmax
+    instances = math.ceil(demand/(mu*lmax))
+    #the levels of the instances of a function sum to at least sum(d)/mu
+    levels = math.ceil(demand/mu)
+    return {
+        'feasible': True,
+        'instances': instances,
+        'objective': nF*levels,
+    }
+
+
+def LPBound(data, time_limit=None):
+    #Lower bound on sum(l*Y) from the LP relaxation of VNFMultiS (sparse backend),
+    #None when the relaxation has no solution
+    from VNFMatrix import build_matrix, solve_matrix
+    problem = build_matrix(data, 'VNFMultiS')
+    problem['integer'][:] = False
+    res = solve_matrix(problem, time_limit)
+    if res.x is None or res.status != 0: #stopped before optimality, res.fun is no bound
+        return None
+    return {'objective': math.ceil(res.fun-1e-6)}
+
+
+def HeuristBound(data):
+    #Lower bound on the cap of NbVNF for which VNFHeurist serves every demand
+    #data: plain data (VNFUtilities.plain_data)
+    #A demand served on the nodes never enters a, so its first subpath leaves o[k] on the arcs
+    #of A unless f[k,1] is located on o[k], and its last subpath enters t[k] on the arcs of A
+    #unless f[k,nb_f] is located on t[k]. f must be located on a node when the demands it
+    #would send through the arcs of the node exceed their capacity (or one arc alone), and
+    #NbVNF allows at most cap*nb_m nodes per function.
+    #Return 0 when there is no demand
+    if not data['d']:
+        return 0
+    uu = data['uu']
+    degree_out = {}
+    degree_in = {}
+    for i, j in data['A']:
+        degree_out[i] = degree_out.get(i, 0)+1
+        degree_in[j] = degree_in.get(j, 0)+1
+    first = {} #(o, f) -> demands leaving o with f first
+    last = {} #(t, f) -> demands entering t with f last
+    for k, d in data['d'].items():
+        first.setdefault((data['o'][k], data['f'][k, 1]), []).append(d)
+        last.setdefault((data['t'][k], data['f'][k, data['nb_f']]), []).append(d)
+    forced = {}
+    for demands, degree in ((first, degree_out), (last, degree_in)):
+        for (i, f), ds in demands.items():
+            if max(ds) > uu or sum(ds) > uu*degree.get(i, 0):
+                forced.setdefault(f, set()).add(i)
+    nodes = max((len(v) for v in forced.values()), default=0)
+    return max(1, math.ceil(nodes/data['nb_m']))
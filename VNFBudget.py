@@ -0,0 +1,86 @@
+from pyomo.environ import minimize
+import math
+import time
+
+
+### Anytime runs under a time budget ###
+###A Budget starts with the run and holds its whole time limit. Every solve gets the time left
+###as its own time limit (Budget.limit), so no single solve can overrun the run. The best
+###solution found so far is kept (Budget.offer) with the best bound known on its objective
+###(Budget.tighten), and is what the run returns, with its gap, when the budget runs out.
+
+MIN_LIMIT = 1 #seconds, the time limit given to a solve started with (almost) nothing left
+
+
+def solver_bound(results, sense=minimize):
+    #bound on the objective reported by the solver (lower bound when minimizing), None if unknown
+    problem = getattr(results, 'problem', None)
+    bound = getattr(problem, 'lower_bound' if sense == minimize else 'upper_bound', None)
+    try:
+        bound = float(bound)
+    except (TypeError, ValueError):
+        return None
+    return bound if math.isfinite(bound) else None
+
+
+class Budget:
+    #time_limit: seconds for the whole run, counted from the creation of the Budget
+    #sense: minimize or maximize, direction of the objective of the solutions offered
+    def __init__(self, time_limit, sense=minimize):
+        self.time_limit = time_limit
+        self.sense = sense
+        self.start = time.time()
+        self.objective = None #best solution offered, None until there is one
+        self.values = None
+        self.bound = None
+
+    def elapsed(self):
+        return time.time()-self.start
+
+    def remaining(self):
+        return max(0, self.time_limit-self.elapsed())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def limit(self, optsolver):
+        #give the time left to the next solve of optsolver, return it
+        optsolver.options['timelimit'] = max(MIN_LIMIT, self.remaining())
+        return optsolver.options['timelimit']
+
+    def better(self, a, b):
+        #True if the objective a is strictly better than b (b None: no solution yet)
+        if b is None:
+            return True
+        return a < b if self.sense == minimize else a > b
+
+    def offer(self, objective, values=None):
+        #keep the solution if it is better than the incumbent, return True if it is kept
+        #values: anything needed to restore the solution (e.g. VNFUtilities.save_values)
+        if objective is None or math.isnan(objective) or not self.better(objective, self.objective):
+            return False
+        self.objective = objective
+        self.values = values
+        return True
+
+    def tighten(self, bound):
+        #keep the bound if it is tighter (larger when minimizing)
+        if bound is not None and (self.bound is None or self.better(self.bound, bound)):
+            self.bound = bound
+
+    @property
+    def gap(self):
+        #relative gap between the incumbent and the bound, None if one of them is unknown
+        if self.objective is None or self.bound is None:
+            return None
+        gap = self.objective-self.bound if self.sense == minimize else self.bound-self.objective
+        return max(0.0, gap)/max(abs(self.objective), 1e-10)
+
+
+def open_budget(budget, time_limit, sense=minimize):
+    #budget: None (a new Budget of time_limit seconds) or a Budget shared with the caller,
+    #which reads the incumbent and its gap from it after the run
+    if isinstance(budget, Budget):
+        budget.sense = sense
+        return budget
+    return Budget(time_limit, sense)
@@ -0,0 +1,178 @@
+from pyomo.environ import *
+from pyomo.opt import SolverResults, SolverStatus, TerminationCondition
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+
+### On-disk cache of the parsed .dat files ###
+###The constraint rules are closures, so a constructed instance cannot be pickled.
+###The cache keeps the data parsed from the .dat file, which is the slow part of create_instance,
+###and the results of the solves (cached_solve).
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.vnf_cache')
+CACHE_MAX_SIZE = 512*1024*1024 #bytes
+CACHE_MAX_AGE = 30*24*3600 #seconds
+
+
+def file_hash(filename):
+    #sha256 of the content of a file
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def instance_key(filename, formulation):
+    #the same .dat file is read differently by each formulation (e.g. the node a)
+    h = hashlib.sha256()
+    h.update(file_hash(filename).encode())
+    h.update(formulation.encode())
+    return h.hexdigest()
+
+
+def _write_entry(path, entry):
+    #write in a temporary file first so that a parallel run never reads a partial entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path+'.%d.tmp' % os.getpid()
+    with open(tmp, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _read_entry(path):
+    #None if the entry does not exist or cannot be read
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(path) #the most recently used entries are evicted last
+    return entry
+
+
+def evict(cache_dir=CACHE_DIR, max_size=CACHE_MAX_SIZE, max_age=CACHE_MAX_AGE):
+    #Remove the entries older than max_age, then the least recently used ones
+    #until the cache holds at most max_size bytes
+    entries = []
+    for root, dirs, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    now = time.time()
+    entries.sort()
+    size = sum(e[1] for e in entries)
+    for mtime, fsize, path in entries:
+        if now-mtime <= max_age and size <= max_size:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        size -= fsize
+
+
+def load_data(model, filename, formulation, cache_dir=CACHE_DIR):
+    #Data of the .dat file in the format accepted by model.create_instance
+    path = os.path.join(cache_dir, 'data', instance_key(filename, formulation)+'.pkl')
+    data = _read_entry(path)
+    if data is None:
+        data = {None: DataPortal(model=model, filename=filename).data()}
+        _write_entry(path, data)
+        evict(cache_dir)
+    return data
+
+
+def create_instance_cached(model, filename, formulation, cache_dir=CACHE_DIR):
+    #Same as model.create_instance(filename) but the .dat file is parsed only once
+    return model.create_instance(load_data(model, filename, formulation, cache_dir))
+
+
+#
+# Results of the solves
+#
+# A result is keyed by the content of the .dat file, the formulation, the VNF cap and the solver
+# (name and options): solving the same probe again loads the stored solution into the instance
+# instead of calling the solver, the values also serve as MIP start. Only the conclusive solves
+# (optimal or infeasible) are stored. The entries of a .dat file are in results/<file hash>, they
+# are evicted with the data entries and removed by invalidate.
+#
+
+CONCLUSIVE = (TerminationCondition.optimal, TerminationCondition.infeasible)
+#options left out of the key: a conclusive result does not depend on them
+#(the time limit changes at every solve of a run under a VNFBudget)
+VOLATILE = ('timelimit',)
+
+
+def result_path(filename, formulation, VNFfix, optsolver, cache_dir=CACHE_DIR):
+    h = hashlib.sha256()
+    solver = {'name': str(getattr(optsolver, 'name', type(optsolver).__name__)),
+              'options': sorted((str(k), str(v)) for k, v in optsolver.options.items() if k not in VOLATILE)}
+    h.update(json.dumps([formulation, VNFfix, solver]).encode())
+    return os.path.join(cache_dir, 'results', file_hash(filename), h.hexdigest()+'.pkl')
+
+
+def cached_solve(filename, formulation, solve=None, names=('Y','Z','X'), cache_dir=CACHE_DIR):
+    #Return a function solve(optsolver, instance, **kwargs) (optsolver.solve by default) memoizing
+    #its results, the cap is instance.VNFfix (None if the instance has no cap)
+    #names: variables whose nonzero values are stored
+    def run(optsolver, instance, **kwargs):
+        VNFfix = value(instance.VNFfix) if hasattr(instance, 'VNFfix') else None
+        path = result_path(filename, formulation, VNFfix, optsolver, cache_dir)
+        entry = _read_entry(path)
+        if entry is not None:
+            for name, values in entry['values'].items():
+                for index, var in getattr(instance, name).items():
+                    var.set_value(values.get(index, 0), skip_validation=True)
+            results = SolverResults()
+            results.solver.status = SolverStatus(entry['status'])
+            results.solver.termination_condition = TerminationCondition(entry['termination'])
+            return results
+        if solve is None:
+            results = optsolver.solve(instance, **kwargs)
+        else:
+            results = solve(optsolver, instance, **kwargs)
+        condition = results.solver.termination_condition
+        if condition in CONCLUSIVE:
+            values = {}
+            if condition == TerminationCondition.optimal:
+                values = {name: {index: var.value for index, var in getattr(instance, name).items()
+                                 if var.value is not None and abs(var.value) > 1e-9} for name in names}
+            _write_entry(path, {'status': str(results.solver.status.value), 'termination': str(condition.value), 'values': values})
+            evict(cache_dir)
+        return results
+    return run
+
+
+def invalidate(filenames=None, cache_dir=CACHE_DIR):
+    #Remove the results of the .dat files, every cached entry if filenames is None
+    if filenames is None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return
+    for filename in filenames:
+        shutil.rmtree(os.path.join(cache_dir, 'results', file_hash(filename)), ignore_errors=True)
+
+
+def main():
+    #python VNFCache.py invalidate [file.dat ...] : results of these files (everything if none)
+    #python VNFCache.py evict                     : apply the size and age limits
+    if len(sys.argv) < 2 or sys.argv[1] not in ('invalidate', 'evict'):
+        print("usage: python VNFCache.py invalidate [file.dat ...] | evict")
+        return
+    if sys.argv[1] == 'invalidate':
+        invalidate(sys.argv[2:] or None)
+    else:
+        evict()
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,121 @@
+from VNFUtilities import shortest_path
+import math
+import os
+import random
+import time
+import tracemalloc
+
+
+### Synthetic instances for scaling studies ###
+###The instances are written in the .dat format read by the AbstractModels (nb_f, F, nb_m, uu,
+###mu, nu, nb_n, nb_d, A, o, t, d, f). The graph is a random spanning tree plus a share
+###<density> of the other node pairs, every link in both directions. The chain of every demand
+###is a permutation of F (each demand uses every function, as D_to_S requires).
+###<tightness> is the ratio between what the demands need and the capacities: link capacity
+###uu against the mean load of the shortest path routing, node capacity nu against the module
+###capacity needed by all the functions. It is a mean, a tight instance can be infeasible.
+
+
+def generate_instance(nb_n, density=0.2, nb_d=None, nb_f=3, nb_m=3, tightness=0.5, dmax=10, seed=0):
+    #Return plain data (same layout as VNFUtilities.plain_data)
+    rng = random.Random(seed)
+    if nb_d is None:
+        nb_d = 2*nb_n
+    N = list(range(1, nb_n+1))
+    F = list(range(1, nb_f+1))
+
+    #random spanning tree: every node is linked to a node already in the tree
+    order = N[:]
+    rng.shuffle(order)
+    edges = set()
+    for p in range(1, nb_n):
+        i, j = order[p], order[rng.randrange(p)]
+        edges.add((min(i, j), max(i, j)))
+    others = [(i, j) for i in N for j in N if i < j and (i, j) not in edges]
+    edges.update(rng.sample(others, int(round(density*len(others)))))
+    A = sorted(edges | set((j, i) for (i, j) in edges))
+
+    o, t, d, f = {}, {}, {}, {}
+    for k in range(1, nb_d+1):
+        o[k], t[k] = rng.sample(N, 2) if nb_n > 1 else (1, 1)
+        d[k] = rng.randint(1, dmax)
+        for s, fs in enumerate(rng.sample(F, nb_f), 1):
+            f[k, s] = fs
+
+    #capacities: one level 1 module serves the largest demand
+    mu = dmax
+    out_arcs = {i: [] for i in N}
+    for (i, j) in A:
+        out_arcs[i].append(j)
+    load = sum(d[k]*(len(shortest_path(out_arcs, o[k], t[k]))-1) for k in d)
+    uu = max(dmax, math.ceil(load/(len(A)*tightness))) if A else dmax
+    modules = math.ceil(nb_f*sum(d.values())/(mu*nb_n*tightness))
+    nu = mu*max(1, modules)
+
+    return {
+        'nb_f': nb_f, 'F': F, 'nb_m': nb_m, 'uu': uu, 'mu': mu, 'nu': nu,
+        'nb_n': nb_n, 'nb_d': nb_d, 'A': A, 'o': o, 't': t, 'd': d, 'f': f,
+    }
+
+
+def write_dat(data, filename):
+    #Write plain data in the .dat format of the models
+    nb_f = data['nb_f']
+    with open(filename, 'w') as out:
+        out.write("param nb_f := %d;\n" % nb_f)
+        out.write("set F := %s;\n" % " ".join(str(f) for f in data['F']))
+        for name in ('nb_m', 'uu', 'mu', 'nu', 'nb_n', 'nb_d'):
+            out.write("param %s := %d;\n" % (name, data[name]))
+        out.write("set A := %s;\n" % " ".join("(%d,%d)" % a for a in data['A']))
+        for name in ('o', 't', 'd'):
+            out.write("param %s := %s;\n" % (name, " ".join("%d %d" % (k, v) for k, v in sorted(data[name].items()))))
+        out.write("param f : %s :=\n" % " ".join(str(s) for s in range(1, nb_f+1)))
+        out.write("\n".join("%d %s" % (k, " ".join(str(data['f'][k, s]) for s in range(1, nb_f+1)))
+                            for k in range(1, data['nb_d']+1)))
+        out.write(";\n")
+
+
+def instance_name(data, density, tightness, seed):
+    return "gen_n%d_d%d_f%d_a%g_c%g_s%d" % (data['nb_n'], data['nb_d'], data['nb_f'], density, tightness, seed)
+
+
+def sweep(sizes, directory='generated', density=0.2, tightness=0.5, seed=0, solve=False, time_limit=60, **options):
+    #Write one instance per size and measure the build time and the peak memory of
+    #VNFMultiS, and its solve time when solve is True
+    from ModelVNFMultiS1 import VNFMultiS, create_solver
+    os.makedirs(directory, exist_ok=True)
+    if solve:
+        optsolver = create_solver()
+        optsolver.options['timelimit'] = time_limit
+    rows = []
+    for nb_n in sizes:
+        data = generate_instance(nb_n, density=density, tightness=tightness, seed=seed, **options)
+        filename = os.path.join(directory, instance_name(data, density, tightness, seed)+".dat")
+        write_dat(data, filename)
+
+        tracemalloc.start()
+        start = time.time()
+        instance = VNFMultiS().create_instance(filename)
+        build = time.time()-start
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        row = {
+            'file': filename, 'nb_n': nb_n, 'nb_d': data['nb_d'], 'arcs': len(data['A']),
+            'variables': instance.nvariables(), 'constraints': instance.nconstraints(),
+            'build': build, 'memory': memory, 'solve': None,
+        }
+        if solve:
+            start = time.time()
+            optsolver.solve(instance)
+            row['solve'] = time.time()-start
+        print(row)
+        rows.append(row)
+    return rows
+
+
+def main():
+    sweep([10, 20, 30, 40, 60, 80], density=0.1, tightness=0.5, seed=0)
+
+if __name__ == '__main__':
+
+    main()
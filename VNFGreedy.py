@@ -0,0 +1,138 @@
+from VNFUtilities import shortest_path, set_module_levels
+import math
+
+
+### Solver free constructive heuristic for the VNFMultiS problem ###
+###Each demand is routed on a shortest path with enough residual link capacity, then the
+###functions of its chain f[k,:] are placed in order on the nodes of that path: an open
+###instance with enough residual capacity first, then an instance whose module level can be
+###raised, then a new instance. The demands are taken by decreasing volume d.
+###Every sub-path of a demand follows the same simple path and the link capacities hold, so the
+###placement serves every demand of VNFHeurist. The routing rows of VNFMultiS also route the layer
+###nb_f twice (routing_subpaths and routing_last_subpath), which puts f[k,nb_f-1] and f[k,nb_f]
+###on t[k]: a placement is only a solution of VNFMultiS if it was built with last_on_destination
+###and route_placement finds its routing, otherwise it is a MIP start.
+
+
+def GreedyPlacement(data, last_on_destination=False):
+    #data: plain data (VNFUtilities.plain_data)
+    #last_on_destination: place f[k,nb_f-1] and f[k,nb_f] on t[k] (VNFMultiS)
+    #Return a dict with
+    # 'level'     : {(i,f): l} module level of every open instance
+    # 'assign'    : {(k,f): i} node serving function f of demand k
+    # 'routes'    : {k: [o,...,t]} path of every served demand
+    # 'objective' : sum(l*Y)
+    # 'VNFfix'    : largest number of instances of a function at the same level (NbVNF cap)
+    # 'feasible'  : True if every demand is served
+    N = range(1, data['nb_n']+1)
+    D = range(1, data['nb_d']+1)
+    S = range(1, data['nb_f']+1)
+    mu, nu, nb_m, uu = data['mu'], data['nu'], data['nb_m'], data['uu']
+    out_arcs = {i: [] for i in N}
+    for (i, j) in data['A']:
+        out_arcs[i].append(j)
+
+    level = {} #(i,f) -> l
+    load = {} #(i,f) -> demand served
+    used = {i: 0 for i in N} #capacity of the modules installed on i
+    arc_load = {}
+    assign = {}
+    routes = {}
+
+    for k in sorted(D, key=lambda k: -data['d'][k]):
+        d = data['d'][k]
+        blocked = set(a for a, v in arc_load.items() if v+d > uu)
+        path = shortest_path(out_arcs, data['o'][k], data['t'][k], blocked)
+        if path is None:
+            continue
+        changes = [] #(i,f,previous level) to undo if the chain cannot be placed
+        pos = 0
+        for s in S:
+            f = data['f'][k, s]
+            best = None
+            first = len(path)-1 if last_on_destination and s >= data['nb_f']-1 else pos
+            for p in range(max(pos, first), len(path)):
+                i = path[p]
+                l = level.get((i, f), 0)
+                need = math.ceil((load.get((i, f), 0)+d)/mu)
+                if need > nb_m or used[i]+mu*(max(need, l)-l) > nu:
+                    continue
+                #open instance with room first, then the cheapest upgrade or opening
+                cost = (0 if need <= l else 1, max(need-l, 0), -(nu-used[i]), p)
+                if best is None or cost < best[0]:
+                    best = (cost, p, need)
+            if best is None:
+                break
+            cost, p, need = best
+            i = path[p]
+            l = level.get((i, f), 0)
+            changes.append((i, f, l))
+            if need > l:
+                used[i] += mu*(need-l)
+                level[i, f] = need
+            load[i, f] = load.get((i, f), 0)+d
+            assign[k, f] = i
+            pos = p
+        else:
+            routes[k] = path
+            for a in zip(path, path[1:]):
+                arc_load[a] = arc_load.get(a, 0)+d
+            continue
+        #undo the functions already placed for k
+        for i, f, l in reversed(changes):
+            load[i, f] -= d
+            used[i] -= mu*(level[i, f]-l)
+            if l:
+                level[i, f] = l
+            else:
+                del level[i, f]
+                del load[i, f]
+        for f in set(data['f'][k, s] for s in S):
+            assign.pop((k, f), None)
+
+    count = {}
+    for (i, f), l in level.items():
+        count[f, l] = count.get((f, l), 0)+1
+    return {
+        'level': level,
+        'assign': assign,
+        'routes': routes,
+        'objective': sum(level.values()),
+        'VNFfix': max(count.values()) if count else 0,
+        'feasible': len(routes) == data['nb_d'],
+    }
+
+
+def greedy_to_instance(solution, instance):
+    #Set the module levels (Y or their compact encoding) and the Z variables of an instance
+    #(VNFMultiS, VNFHeurist, ...) to the greedy placement,
+    #to be used as MIP start. The routing X is left to the solver.
+    set_module_levels(instance, solution['level'])
+    served = set(k for (k, f) in solution['assign'])
+    a = instance.a.value if hasattr(instance, 'a') else None
+    for (i, k, f), var in instance.Z.items():
+        if k in served:
+            value = solution['assign'].get((k, f)) == i
+        else:
+            value = i == a #demand not served, assigned to the node a when it exists
+        var.set_value(float(value), skip_validation=True)
+
+
+def route_placement(data, solution, time_limit=None):
+    #Routing of a placement (GreedyPlacement) in VNFMultiS: the Y and Z columns of the sparse
+    #problem are fixed to the placement and the routing is solved with the HiGHS of scipy
+    #Return {'X': {index: value}} (load_values), None if the placement cannot be routed
+    from VNFMatrix import build_matrix, column_indices, solve_matrix
+    problem = build_matrix(data, 'VNFMultiS')
+    for j, (name, index) in enumerate(column_indices(problem)):
+        if name == 'Y':
+            value = float(solution['level'].get(index[:2]) == index[2])
+        elif name == 'Z':
+            value = float(solution['assign'].get(index[1:]) == index[0])
+        else:
+            continue
+        problem['lb'][j] = problem['ub'][j] = value
+    res = solve_matrix(problem, time_limit)
+    if res.x is None or res.status != 0:
+        return None
+    return {'X': {index: float(round(x)) for (name, index), x in zip(column_indices(problem), res.x) if name == 'X'}}
@@ -1,6 +1,12 @@
 from pyomo.environ import *
 from pyomo.opt import SolverFactory
 from pyomo.opt import SolverStatus, TerminationCondition
+from VNFUtilities import *
+from VNFResults import *
+from VNFCache import *
+from VNFTrace import *
+from VNFBudget import *
+import numpy as np
 import time
 
 
@@ -11,7 +17,11 @@ import os, sys
 sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),'../utilities')))
 from optmodel_utilities import *
 
-def create_solver(solver_name = 'cplex'):
+def create_solver(solver_name = 'cplex', persistent = False):
+    #persistent: the model stays loaded in the solver between the solves (solver Python API),
+    #only the changes are sent (VNFUtilities.push_vars / push_constraints)
+    if persistent:
+        return SolverFactory(solver_name+'_persistent')
     solver_path = get_solver_path(solver_name)
     return  SolverFactory(solver_name, executable=str(solver_path), solver_io = 'nl')    
 
@@ -19,7 +29,7 @@ def create_solver(solver_name = 'cplex'):
 # Model
 #
 
-def VNFHeurist1(VNFix):
+def VNFHeurist1(VNFix, symmetry=False):
     
     infinity = float('inf')
     
@@ -81,6 +91,10 @@ def VNFHeurist1(VNFix):
     #Arcs union {a}
     #model.AMD=Set(within=model.N_a*model.N_a)
     model.AMD=model.all_a | model.a_all | model.A
+    
+    #Out/in neighbours of each node, built once from A and AMD
+    add_adjacency(model,'A','N','N')
+    add_adjacency(model,'AMD','N_a','N')
 
     #Demand parameters
     model.o = Param(model.D,within=NonNegativeIntegers)
@@ -131,7 +145,7 @@ def VNFHeurist1(VNFix):
     
     #Constraint 4 : a simple path is used to route each demand
     def routing_first_subpath(model,i,k):
-        value=sum(model.X[i,j,k,1] for j in model.N if (i,j) in model.AMD) - sum(model.X[j,i,k,1] for j in model.N if (i,j) in model.AMD)
+        value=sum(model.X[i,j,k,1] for j in model.AMD_out[i]) - sum(model.X[j,i,k,1] for j in model.AMD_in[i])
 
         if i == model.o[k] :
             return value == 1-model.Z[i,k,model.f[k,1]]
@@ -142,7 +156,7 @@ def VNFHeurist1(VNFix):
     
     #Constraint 5 : a simple path is used to route each demand
     def routing_last_subpath(model,i,k):
-        value = sum(model.X[i,j,k,model.nb_f] for j in model.N if (i,j) in model.AMD) - sum(model.X[j,i,k,model.nb_f] for j in model.N if (i,j) in model.AMD)
+        value = sum(model.X[i,j,k,model.nb_f] for j in model.AMD_out[i]) - sum(model.X[j,i,k,model.nb_f] for j in model.AMD_in[i])
         if i == model.t[k] :
             return value == model.Z[i,k,model.f[k,model.nb_f]]-1
         else :
@@ -154,7 +168,7 @@ def VNFHeurist1(VNFix):
     def simple_path1(model,i,k):
         #if not any(model.X[j,i,k,s] for j in model.N if (j,i) in model.AMD for s in model.S1):
          #   return Constraint.Skip
-        value = sum(sum(model.X[j,i,k,s] for j in model.N if (j,i) in model.AMD) for s in model.S1)
+        value = sum(sum(model.X[j,i,k,s] for j in model.AMD_in[i]) for s in model.S1)
         return value <= 1
     
     model.simple_path1_const = Constraint(model.N_a,model.D,rule= simple_path1)
@@ -163,78 +177,110 @@ def VNFHeurist1(VNFix):
     def simple_path2(model,i,k):
         #if not any(model.X[i,j,k,s] for j in model.N if (i,j) in model.AMD for s in model.S1):
         #    return Constraint.Skip
-        value=sum(sum(model.X[i,j,k,s] for j in model.N if (i,j) in model.A) for s in model.S1)
+        value=sum(sum(model.X[i,j,k,s] for j in model.A_out[i]) for s in model.S1)
         return value <= 1
 
     model.simple_path2_const = Constraint(model.N,model.D,rule= simple_path2)
     
     #Constraint 8 : given the number of installed VNF
+    #the cap is a mutable parameter so that one instance can be solved for several caps
+    model.VNFfix=Param(initialize=VNFix,mutable=True)
+    
     def NbVNF(model,f,l):
         value=sum(model.Y[i,f,l] for i in model.N)
-        return value <= VNFix
+        return value <= model.VNFfix
     
     model.NbVNF_const=Constraint(model.F,model.L,rule = NbVNF)
     
     #Constraint 9 :  using arcs incident in a for routing a demand that is not served by the VNF on a
     def Paths2_a(model,k,f):
-        value=sum(sum(model.X[i,model.a.value,k,s] for i in model.N if (i,model.a.value) in model.AMD) for s in model.S1)
+        value=sum(sum(model.X[i,model.a.value,k,s] for i in model.AMD_in[model.a.value]) for s in model.S1)
         return value <= model.Z[model.a.value,k,f]
 
     model.Paths2a_const = Constraint(model.D,model.F,rule= Paths2_a)
     
     
+    #Symmetry breaking (optional) : interchangeable nodes ordered by module level
+    if symmetry:
+        add_symmetry_breaking(model)
+
     return model
 
-def AFRHeurist(file,Limit):
+def AFRHeurist(file,Limit,trace=None,persistent=False,output="resultat heureustique.npz",threads=None,budget=None):
+    #trace: file name (or VNFTrace.Trace) receiving the JSON lines of every phase
+    #persistent: the instance stays loaded in a persistent solver, only the fixed Z are sent
+    #output: solution file (VNFResults), threads: threads of every solve (solver default if None)
+    #budget: VNFBudget.Budget of the run (a new one of Limit seconds if None), every solve gets the
+    #time left. Its objective is the returned one: the number of instances of the solution serving
+    #every demand, bounded by |F| (an instance of every function). When the budget runs out before
+    #every demand is served, the solution serving the most demands is written in output
+    #Return the number of instances of the solution, None if there is none
+    trace = open_trace(trace, heuristic='AFRHeurist', file=file)
+    budget = open_budget(budget, Limit)
+    
     # chosing the solver
-    optsolver =  create_solver()
+    optsolver =  create_solver(persistent=persistent)
+    if threads is not None:
+        optsolver.options['threads'] = threads
 
-    model=VNFHeurist1(1) #create model
+    with trace.phase('build', formulation='VNFHeurist1') as rec:
+        model=VNFHeurist1(1) #create model
         
-    instance = model.create_instance(file+".dat")#create
+        instance = create_instance_cached(model,file+".dat",'VNFHeurist1')#create
+        rec.update(model_size(instance))
     
+    #the cap is mutable, no need to rebuild the instance once nb_n is known
     VNFix=instance.nb_n.value
+    instance.VNFfix = VNFix
+    attach_instance(optsolver, instance)
     res1=0
-
-
     
-    model=VNFHeurist1(VNFix) #create model
-        
-    instance = model.create_instance(file+".dat")#create
+    #the assignments are read and fixed as arrays, only the Z of the nodes of N are fixed
+    Z = VarBlock(instance.Z)
+    inN = Z.index[:,0] != instance.a.value
+
     print("la valeur du n", instance.nb_n.value)
+    budget.tighten(len(instance.F))
+    partial = None #(demands served, values) of the best solution that does not serve every demand
     starttime=time.time()
-    while (time.time()-starttime)<Limit :
-        results = optsolver.solve(instance)# resolve problem
+    while not budget.expired():
+        #the solution of the previous iteration is used as MIP start
+        trace.iteration += 1
+        budget.limit(optsolver)
+        results = trace.solve(optsolver, instance, 'integer', solve_warm, VNFfix=VNFix)# resolve problem
         res0=(getObjectiveValue(instance))/3 # objective
         print("le nombre de demande",instance.nb_d.value)
         print("Le temps limite",Limit)
-        if res0 == instance.nb_d.value:
-            results = optsolver.solve(instance) # resolve problem
-            filename = open("resultat heureustique.txt",'w')
-            printObjectiveValue(instance, filename)
-            printPointFromModel(instance, filename)
-            filename.close()
-            a=0
-            for i in instance.N_a:
-                for f in instance.F:
-                    for l in instance.L:
-                        a=a+instance.Y[i,f,l].value
+        if res0 >= instance.nb_d.value-1e-6:
+            budget.limit(optsolver)
+            results = trace.solve(optsolver, instance, 'integer', solve_warm, VNFfix=VNFix) # resolve problem
+            write_results(instance, output)
+            a=float(np.nansum(VarBlock(instance.Y).values()))
+            budget.offer(a)
             #a = getObjectiveValue(instance)
             print("Le temps d'exécution ",time.time()-starttime)
-            return print("le nombre de demande servi avec l'heuristique pour une fonction est ",a)
+            trace.record('end', VNFfix=VNFix, objective=a, duration=time.time()-starttime, bound=budget.bound, gap=budget.gap)
+            print("le nombre de demande servi avec l'heuristique pour une fonction est ",a)
+            return a
 
         
+        if partial is None or res0 > partial[0]:
+            partial = (res0, save_values(instance))
         if res1< res0 and res0<instance.nb_d.value:
-            for i in instance.N:
-                for k in instance.D:
-                    for f in instance.F:
-                        if instance.Z[i,k,f].value == 1:
-                            print("instance.Z[i,k,f].value ")
-                            instance.Z[i,k,f].fixe() #{ fix Z}
+            fixed = Z.fix((Z.values() > 0.5) & inN & ~Z.fixed()) #{ fix Z}
+            print("Z fixes", len(fixed))
+            push_vars(optsolver, fixed)
                
             res1 = res0
 
-    return print("No feasible solution found")
+    #the budget ran out, the best partial solution is kept
+    if partial is not None:
+        load_values(instance, partial[1])
+        write_results(instance, output)
+        print("demandes servies", partial[0], "sur", instance.nb_d.value)
+    trace.record('end', VNFfix=VNFix, objective=None, duration=time.time()-starttime, bound=budget.bound, gap=budget.gap)
+    print("No feasible solution found")
+    return None
 
 def main():
     # file 
@@ -259,10 +305,7 @@ def main():
 
     objective =  getObjectiveValue(instance)
     print("Optimal solution found with value ", objective)
-    filename = open("di-yuan_s_s_l_l.txt",'w')
-    printObjectiveValue(instance, filename)
-    printPointFromModel(instance, filename)
-    filename.close()
+    write_results(instance, "di-yuan_s_s_l_l.npz")
     #printPointFromModel(instance)
 '''
 if __name__ == '__main__':    
@@ -0,0 +1,313 @@
+from VNFUtilities import shortest_path
+import heapq
+import time
+
+
+### Lagrangian relaxation of VNFHeurist ###
+###VNFHeurist asks how many assignments Z[i,k,f] (i in N) can be made when every function has at
+###most VNFfix instances on each module level. Only the first subpath (from o[k] to the node of
+###f[k,1]) and the last one (from the node of f[k,nb_f] to t[k]) are routed, and a demand may be
+###assigned to the auxiliary node a, entered only by a demand with all its functions on a
+###(Paths2a_const). Dualizing the link capacities Link_capacity_const of all the arcs, those of a
+###included (multipliers lam[i,j] >= 0), and the assignment rows Z[i,k,f] <= sum(Y[i,f,l]) of the
+###nodes of N (multipliers pi[i,k,f] >= 0, the instances on a are free) splits it into
+### - one choice per demand: the function f on node i gains 1-pi[i,k,f] and 0 on a, the first
+###   and last subpaths cost d[k]*lam on their arcs (cheapest paths on A, the last one may start
+###   from a), or every function on a through the arcs (o[k],a) and (a,.).
+### - one placement per function and level: the VNFfix nodes of largest sum(pi[i,k,f]).
+###The simple path rows are dropped as well, so the value bounds the objective of VNFHeurist
+###(nb_d*|F| when every demand is served) from above, and is minimized over the multipliers by
+###subgradient steps. At every step the relaxed solution is also repaired into a feasible one:
+###each function is opened on the nodes the demands use most, then the demands are routed with
+###their whole chain one by one in the residual link capacities.
+
+
+def layered_path(out_arcs, o, t, chain, arc_cost, serve_cost, blocked=(), allowed=None):
+    #Cheapest walk from o to t serving chain[0], chain[1], ... in this order (fewest hops among
+    #the cheapest), None if there is none
+    #arc_cost(i,j), serve_cost(i,s): cost of the arc (i,j) and of serving chain[s-1] on i
+    #allowed: {f: nodes} where f can be served, every node if None
+    #Return (cost, nodes, hosts): nodes of the walk, hosts[s-1] the node serving chain[s-1]
+    n = len(chain)
+    dist = {(o, 0): (0, 0)}
+    prev = {(o, 0): None}
+    heap = [(0, 0, o, 0)]
+    while heap:
+        cost, hops, i, s = heapq.heappop(heap)
+        if (cost, hops) > dist[i, s]:
+            continue
+        if i == t and s == n:
+            break
+        moves = [(j, s, arc_cost(i, j), 1) for j in out_arcs[i] if (i, j) not in blocked]
+        if s < n and (allowed is None or i in allowed[chain[s]]):
+            moves.append((i, s+1, serve_cost(i, s+1), 0))
+        for j, q, step, hop in moves:
+            key = (cost+step, hops+hop)
+            if key < dist.get((j, q), (float('inf'), 0)):
+                dist[j, q] = key
+                prev[j, q] = (i, s)
+                heapq.heappush(heap, (key[0], key[1], j, q))
+    if (t, n) not in dist:
+        return None
+    states = [(t, n)]
+    while prev[states[-1]] is not None:
+        states.append(prev[states[-1]])
+    states.reverse()
+    nodes = [o]
+    hosts = []
+    for (i, s), (j, q) in zip(states, states[1:]):
+        if q > s:
+            hosts.append(i)
+        else:
+            nodes.append(j)
+    return dist[t, n][0], nodes, hosts
+
+
+def cheapest_paths(neighbours, source, cost):
+    #Dijkstra from source, cost(i,j) >= 0 of the move from i to its neighbour j
+    #Return (dist, prev): cost of the cheapest path to every node reached and its previous node
+    dist = {source: 0}
+    prev = {source: None}
+    heap = [(0, source)]
+    while heap:
+        c, i = heapq.heappop(heap)
+        if c > dist[i]:
+            continue
+        for j in neighbours[i]:
+            if c+cost(i, j) < dist.get(j, float('inf')):
+                dist[j] = c+cost(i, j)
+                prev[j] = i
+                heapq.heappush(heap, (dist[j], j))
+    return dist, prev
+
+
+def walk(prev, i):
+    #nodes from i back to the source of cheapest_paths
+    nodes = [i]
+    while prev[nodes[-1]] is not None:
+        nodes.append(prev[nodes[-1]])
+    return nodes
+
+
+def best_choice(data, k, lam, pi, out_arcs, in_arcs):
+    #Lagrangian subproblem of the demand k, out_arcs/in_arcs the neighbours on A
+    #Return (value, hosts, arcs): hosts {f: node} of every function (a is data.get('a', 0)),
+    #arcs those of the first and last subpaths, None if k cannot be routed at all
+    a = data.get('a', 0)
+    d = data['d'][k]
+    o, t = data['o'][k], data['t'][k]
+    first, last = data['f'][k, 1], data['f'][k, data['nb_f']]
+    N = range(1, data['nb_n']+1)
+    cost = lambda i, j: d*lam.get((i, j), 0)
+    gain = lambda i, f: 1-pi.get((i, k, f), 0)
+    usable = d <= data['uu'] #X = 0 on every arc otherwise
+    if usable:
+        to_node, prev_to = cheapest_paths(out_arcs, o, cost)
+        from_node, prev_from = cheapest_paths(in_arcs, t, lambda i, j: cost(j, i))
+    else:
+        to_node, prev_to, from_node, prev_from = {o: 0}, {o: None}, {t: 0}, {t: None}
+    #first subpath to i, last subpath from j (from a through the arc (a,j) if leave_a)
+    first_leg = lambda i: walk(prev_to, i)[::-1]
+    last_leg = lambda j, leave_a=False: [a]*leave_a+walk(prev_from, j)
+    exit_a = min(from_node, key=lambda j: cost(a, j)+from_node[j]) if usable else None
+    exit_cost = cost(a, exit_a)+from_node[exit_a] if usable else None
+
+    #the functions that are not routed go to their best node, or to a if it gains nothing
+    hosts = {}
+    for f in data['F']:
+        i = max(N, key=lambda i: gain(i, f))
+        hosts[f] = i if gain(i, f) > 0 else a
+    value = sum(gain(i, f) for f, i in hosts.items() if i != a and f not in (first, last))
+    best = None
+    if first == last:
+        i = max(to_node.keys() & from_node.keys(), key=lambda i: gain(i, first)-to_node[i]-from_node[i], default=None)
+        if i is not None:
+            best = (value+gain(i, first)-to_node[i]-from_node[i], i, i, first_leg(i), last_leg(i))
+    else:
+        i = max(to_node, key=lambda i: gain(i, first)-to_node[i])
+        j = max(from_node, key=lambda j: gain(j, last)-from_node[j])
+        best = (value+gain(i, first)-to_node[i]+gain(j, last)-from_node[j], i, j, first_leg(i), last_leg(j))
+        #f[k,nb_f] on a
+        if usable and -exit_cost > gain(j, last)-from_node[j]:
+            best = (value+gain(i, first)-to_node[i]-exit_cost, i, a, first_leg(i), last_leg(exit_a, True))
+    #every function on a: the first subpath enters a, the last one leaves it
+    if usable:
+        i = min(to_node, key=lambda i: to_node[i]+cost(i, a))
+        value = -(to_node[i]+cost(i, a)+exit_cost)
+        if best is None or value > best[0]:
+            nodes = first_leg(i)+last_leg(exit_a, True)
+            return value, {f: a for f in data['F']}, list(zip(nodes, nodes[1:]))
+    if best is None:
+        return None
+    value, hosts[first], hosts[last], leg1, leg2 = best
+    return value, hosts, list(zip(leg1, leg1[1:]))+list(zip(leg2, leg2[1:]))
+
+
+def is_simple(nodes):
+    #no node entered or left twice (simple_path1/2), the route may end on its origin
+    return len(set(nodes[:-1])) == len(nodes)-1 and len(set(nodes[1:])) == len(nodes)-1
+
+
+def route_legs(out_arcs, stops, blocked=()):
+    #Simple route through the stops, every leg on a shortest path avoiding the nodes already
+    #used, None if it fails
+    nodes = [stops[0]]
+    for (a, b) in zip(stops, stops[1:]):
+        if a == b:
+            continue
+        path = shortest_path(out_arcs, a, b, blocked, set(nodes)-set([a, b]))
+        if path is None:
+            return None
+        nodes += path[1:]
+    return nodes if is_simple(nodes) else None
+
+
+def repair(data, out_arcs, VNFfix, paths, weight, lam):
+    #Feasible solution of VNFHeurist from the paths of the relaxation: open every function on
+    #the nodes the most used by the paths, then route the demands (served by the relaxation first,
+    #cheapest first, then by increasing volume) in the residual link capacities
+    N = range(1, data['nb_n']+1)
+    S = range(1, data['nb_f']+1)
+    capacity = min(VNFfix*data['nb_m'], data['nb_n'])
+    score = dict(weight)
+    for k, (cost, nodes, hosts) in paths.items():
+        for s in S:
+            key = (hosts[s-1], data['f'][k, s])
+            score[key] = score.get(key, 0)+1
+    level = {}
+    opened = {}
+    for f in data['F']:
+        ranked = sorted(N, key=lambda i: (-score.get((i, f), 0), -len(out_arcs[i]), i))[:capacity]
+        opened[f] = set(ranked)
+        for p, i in enumerate(ranked):
+            level[i, f] = p//VNFfix+1
+
+    order = sorted(paths, key=lambda k: paths[k][0])
+    order += sorted((k for k in range(1, data['nb_d']+1) if k not in paths), key=lambda k: data['d'][k])
+    none = {i: [] for i in N}
+    load = {}
+    assign = {}
+    routes = {}
+    for k in order:
+        d = data['d'][k]
+        chain = [data['f'][k, s] for s in S]
+        arcs = out_arcs if d <= data['uu'] else none
+        blocked = set(a for a, v in load.items() if v+d > data['uu'])
+        found = layered_path(arcs, data['o'][k], data['t'][k], chain,
+                             lambda i, j: d*lam.get((i, j), 0), lambda i, s: 0, blocked, opened)
+        if found is None:
+            continue
+        cost, nodes, hosts = found
+        if not is_simple(nodes):
+            nodes = route_legs(arcs, [data['o'][k]]+hosts+[data['t'][k]], blocked)
+            if nodes is None:
+                continue
+        for s in S:
+            assign[k, chain[s-1]] = hosts[s-1]
+        routes[k] = nodes
+        for a in zip(nodes, nodes[1:]):
+            load[a] = load.get(a, 0)+d
+    return {
+        'level': level,
+        'assign': assign,
+        'routes': routes,
+        'served': len(routes),
+        'feasible': len(routes) == data['nb_d'],
+    }
+
+
+def LagrangianPlacement(data, VNFfix, iterations=100, multipliers=None, time_limit=None, decide=False):
+    #data: plain data (VNFUtilities.plain_data), VNFfix: cap of NbVNF_const
+    #multipliers: the 'multipliers' of a previous call (warm start, e.g. at another cap)
+    #decide: stop as soon as it is known whether every demand can be served
+    #Return a dict with
+    # 'bound'       : upper bound on the objective of VNFHeurist (nb_d*|F| if every demand is served)
+    # 'served'      : demands served by the best repaired solution
+    # 'level', 'assign', 'routes' : that solution (layout of VNFGreedy.GreedyPlacement)
+    # 'feasible'    : True if it serves every demand
+    # 'multipliers' : {'lam': {(i,j): value}, 'pi': {(i,k,f): value}}
+    # 'iterations'  : number of subgradient steps
+    time_start = time.time()
+    N = range(1, data['nb_n']+1)
+    S = range(1, data['nb_f']+1)
+    nb_d, uu, nb_m = data['nb_d'], data['uu'], data['nb_m']
+    full = nb_d*len(data['F']) #objective when every demand is served
+    out_arcs = {i: [] for i in N}
+    in_arcs = {i: [] for i in N}
+    for (i, j) in data['A']:
+        out_arcs[i].append(j)
+        in_arcs[j].append(i)
+    lam = dict(multipliers['lam']) if multipliers else {}
+    pi = dict(multipliers['pi']) if multipliers else {}
+
+    bound = float('inf')
+    best = None
+    theta = 2.0
+    stall = 0
+    for iteration in range(1, iterations+1):
+        #placement: on every level the VNFfix nodes of largest weight, only those of positive
+        #weight add to the value (a node may hold several levels of a function)
+        weight = {}
+        for (i, k, f), p in pi.items():
+            weight[i, f] = weight.get((i, f), 0)+p
+        opened = set()
+        for f in data['F']:
+            ranked = sorted((i for i in N if weight.get((i, f), 0) > 0), key=lambda i: -weight[i, f])
+            opened.update((i, f) for i in ranked[:VNFfix])
+        value = nb_m*sum(weight[key] for key in opened)+uu*sum(lam.values())
+
+        #one choice per demand
+        paths = {}
+        Z = set()
+        load = {}
+        for k in range(1, nb_d+1):
+            found = best_choice(data, k, lam, pi, out_arcs, in_arcs)
+            if found is None:
+                continue
+            choice, hosts, arcs = found
+            value += choice
+            Z.update((i, k, f) for f, i in hosts.items() if i in N)
+            for arc in arcs:
+                load[arc] = load.get(arc, 0)+data['d'][k]
+            if all(hosts[data['f'][k, s]] in N for s in S):
+                paths[k] = (-choice, None, [hosts[data['f'][k, s]] for s in S])
+        if value < bound-1e-9:
+            bound = value
+            stall = 0
+        else:
+            stall += 1
+            if stall >= 5:
+                theta /= 2
+                stall = 0
+
+        solution = repair(data, out_arcs, VNFfix, paths, weight, lam)
+        if best is None or solution['served'] > best['served']:
+            best = solution
+        #the objective is an integer, the repaired solution has at least |F| per demand served
+        lower = len(data['F'])*best['served']
+        if bound < lower+1-1e-6 or theta < 1e-3:
+            break
+        if decide and (best['feasible'] or bound < full-1e-6):
+            break
+        if time_limit is not None and time.time()-time_start > time_limit:
+            break
+
+        #projected subgradient step: g = load-uu on the links, Z-sum(Y) on the assignments
+        g_lam = {a: load.get(a, 0)-uu for a in set(lam) | set(load)}
+        g_lam = {a: g for a, g in g_lam.items() if g > 0 or lam.get(a, 0) > 0}
+        g_pi = {key: (key in Z)-nb_m*((key[0], key[2]) in opened) for key in set(pi) | Z}
+        g_pi = {key: g for key, g in g_pi.items() if g > 0 or pi.get(key, 0) > 0}
+        norm = sum(g*g for g in g_lam.values())+sum(g*g for g in g_pi.values())
+        if norm == 0:
+            break
+        step = theta*(value-lower)/norm
+        for a, g in g_lam.items():
+            lam[a] = max(0, lam.get(a, 0)+step*g)
+        for key, g in g_pi.items():
+            pi[key] = max(0, pi.get(key, 0)+step*g)
+        lam = {a: v for a, v in lam.items() if v > 0}
+        pi = {key: v for key, v in pi.items() if v > 0}
+
+    best = dict(best)
+    best.update(bound=bound, multipliers={'lam': lam, 'pi': pi}, iterations=iteration)
+    return best
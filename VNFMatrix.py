@@ -0,0 +1,455 @@
+import itertools
+import numpy as np
+import scipy.sparse as sp
+
+
+### Sparse matrix generator for the VNF formulations ###
+###The constraint families of VNFMultiS, VNFHeurist and VNFHeuristR (ModelVNFHeurist2) are
+###assembled directly as numpy index arrays and a scipy CSR matrix, without building one
+###Pyomo expression per coefficient. The rows and columns follow the Pyomo declaration order
+###and the Pyomo names, so a solution can be loaded back into an instance and printed as usual.
+
+
+#
+# Problem description
+#
+
+def _positions(values):
+    #lookup array giving the position of each (non negative integer) value
+    values = np.asarray(values, dtype=np.int64)
+    pos = np.full(int(values.max())+1 if len(values) else 1, -1, dtype=np.int64)
+    pos[values] = np.arange(len(values))
+    return pos
+
+
+def _graph(data, formulation):
+    #nodes, arcs and the rule used by add_adjacency for the neighbours
+    N = list(range(1, data['nb_n']+1))
+    A = [tuple(a) for a in data['A']]
+    if formulation == 'VNFMultiS':
+        return N, N, A
+    a = data.get('a', 0)
+    AMD = [(i, a) for i in N]+[(a, i) for i in N]+A
+    return [a]+N, N, AMD
+
+
+def build_matrix(data, formulation='VNFHeurist', VNFfix=None):
+    #Build the formulation as a sparse problem
+    #data: plain data (VNFUtilities.plain_data)
+    #formulation: 'VNFMultiS', 'VNFHeurist' or 'VNFHeuristR' (LP relaxation of VNFHeurist)
+    #VNFfix: VNF cap, None drops NbVNF (VNFMultiS of ModelVNFMultiS1)
+    nodes, N, arcs = _graph(data, formulation)
+    F = list(data['F'])
+    nb_f = data['nb_f']
+    L = list(range(1, data['nb_m']+1))
+    D = list(range(1, data['nb_d']+1))
+    S1 = list(range(1, nb_f+2))
+    nN, nF, nL, nD, nS1, nA = len(nodes), len(F), len(L), len(D), len(S1), len(arcs)
+
+    npos = _positions(nodes)
+    fpos = _positions(F)
+    inN = np.zeros(len(npos), dtype=bool)
+    inN[N] = True
+    tail = npos[np.array([a[0] for a in arcs], dtype=np.int64)]
+    head = npos[np.array([a[1] for a in arcs], dtype=np.int64)]
+    tail_in_N = inN[np.array([a[0] for a in arcs], dtype=np.int64)]
+    head_in_N = inN[np.array([a[1] for a in arcs], dtype=np.int64)]
+    in_A = np.zeros(nA, dtype=bool)
+    in_A[nA-len(data['A']):] = True
+
+    d = np.array([data['d'][k] for k in D], dtype=float)
+    o = npos[np.array([data['o'][k] for k in D], dtype=np.int64)]
+    t = npos[np.array([data['t'][k] for k in D], dtype=np.int64)]
+    #chain[k,s-1] = position in F of f[k,s]
+    chain = fpos[np.array([[data['f'][k, s] for s in range(1, nb_f+1)] for k in D], dtype=np.int64)]
+
+    #columns
+    offY = 0
+    offZ = offY+nN*nF*nL
+    offX = offZ+nN*nD*nF
+    ncols = offX+nA*nD*nS1
+
+    def Y(i, f, l):
+        return offY+(i*nF+f)*nL+l
+
+    def Z(i, k, f):
+        return offZ+(i*nD+k)*nF+f
+
+    def X(a, k, s):
+        return offX+(a*nD+k)*nS1+s
+
+    rows, cols, vals, lo, hi, blocks = [], [], [], [], [], []
+    nrows = [0]
+
+    def add(name, shape, r, c, v, rlo, rhi, index):
+        #r are local row numbers in [0,prod(shape)), rlo/rhi scalars or arrays of that size
+        size = int(np.prod(shape))
+        r, c, v = np.broadcast_arrays(np.asarray(r).ravel(), np.asarray(c).ravel(), np.asarray(v, dtype=float).ravel())
+        rows.append(r+nrows[0])
+        cols.append(c)
+        vals.append(v)
+        lo.append(np.broadcast_to(np.asarray(rlo, dtype=float).ravel(), (size,)))
+        hi.append(np.broadcast_to(np.asarray(rhi, dtype=float).ravel(), (size,)))
+        blocks.append((name, index, nrows[0], size))
+        nrows[0] += size
+
+    g = np.meshgrid
+    iN = np.array([npos[i] for i in N], dtype=np.int64)
+    ia, ik, i_s, if_, il = np.arange(nA), np.arange(nD), np.arange(nS1), np.arange(nF), np.arange(nL)
+    inf = np.inf
+
+    def flow(s):
+        #out-in flow of the sub-path s (position in S1) as rows node*nD+k
+        #the neighbours are the ones of add_adjacency, i.e. restricted to N
+        A_, K = g(ia, ik, indexing='ij')
+        r_out = tail[A_]*nD+K
+        r_in = head[A_]*nD+K
+        keep_out = head_in_N[A_]
+        keep_in = tail_in_N[A_]
+        c = X(A_, K, s)
+        return (np.concatenate([r_out[keep_out], r_in[keep_in]]),
+                np.concatenate([c[keep_out], c[keep_in]]),
+                np.concatenate([np.ones(keep_out.sum()), -np.ones(keep_in.sum())]))
+
+    if formulation == 'VNFMultiS':
+        sense = 1
+        #objective: sum(l*Y[i,f,l])
+        c = np.zeros(ncols)
+        I, Fp, Lp = g(np.arange(nN), if_, il, indexing='ij')
+        c[Y(I, Fp, Lp)] = Lp+1
+
+        #Demand_Service
+        K, Fp, I = g(ik, if_, np.arange(nN), indexing='ij')
+        add('Demand_Service', (nD, nF), K*nF+Fp, Z(I, K, Fp), 1, 1, 1, [D, F])
+
+        #NbVNF_open
+        if VNFfix is not None:
+            Fp, Lp, I = g(if_, il, np.arange(nN), indexing='ij')
+            add('NbVNF_open_constraint', (nF, nL), Fp*nL+Lp, Y(I, Fp, Lp), 1, VNFfix, VNFfix, [F, L])
+
+        #Demand_Service_node
+        I, K, Fp = g(np.arange(nN), ik, if_, indexing='ij')
+        r = (I*nD+K)*nF+Fp
+        I2, K2, Fp2, Lp2 = g(np.arange(nN), ik, if_, il, indexing='ij')
+        add('Demand_Service_node', (nN, nD, nF),
+            np.concatenate([r.ravel(), ((I2*nD+K2)*nF+Fp2).ravel()]),
+            np.concatenate([Z(I, K, Fp).ravel(), Y(I2, Fp2, Lp2).ravel()]),
+            np.concatenate([np.ones(r.size), -np.ones(I2.size)]), -inf, 0, [N, D, F])
+
+        #routing_subpaths, s in 2..nb_f
+        nS = nb_f-1
+        rr, cc, vv = [], [], []
+        for s in range(2, nb_f+1):
+            r, c_, v = flow(s-1)
+            node, k = r//nD, r % nD
+            rr.append((node*nD+k)*nS+(s-2))
+            cc.append(c_)
+            vv.append(v)
+            I, K = g(np.arange(nN), ik, indexing='ij')
+            base = (I*nD+K)*nS+(s-2)
+            rr += [base.ravel(), base.ravel()]
+            cc += [Z(I, K, chain[K, s-2]).ravel(), Z(I, K, chain[K, s-1]).ravel()]
+            vv += [-np.ones(base.size), np.ones(base.size)]
+        if nS > 0:
+            add('routing_subpaths_Const', (nN, nD, nS), np.concatenate(rr), np.concatenate(cc), np.concatenate(vv),
+                0, 0, [N, D, list(range(2, nb_f+1))])
+
+        #Link_Capacity
+        A_, K, S_ = g(ia, ik, i_s, indexing='ij')
+        add('Link_capacity_const', (nA,), A_, X(A_, K, S_), d[K], -inf, data['uu'], [arcs])
+    else:
+        sense = -1
+        a = nodes[0]
+        #objective: sum(Z[i,k,f]) over N
+        c = np.zeros(ncols)
+        I, K, Fp = g(iN, ik, if_, indexing='ij')
+        c[Z(I, K, Fp)] = 1
+
+        #Demand_Service
+        K, Fp, I = g(ik, if_, np.arange(nN), indexing='ij')
+        add('Demand_Service', (nD, nF), K*nF+Fp, Z(I, K, Fp), 1, 1, 1, [D, F])
+
+        #Demand_Service_node
+        I, K, Fp = g(np.arange(nN), ik, if_, indexing='ij')
+        r = (I*nD+K)*nF+Fp
+        I2, K2, Fp2, Lp2 = g(np.arange(nN), ik, if_, il, indexing='ij')
+        add('Demand_Service_node', (nN, nD, nF),
+            np.concatenate([r.ravel(), ((I2*nD+K2)*nF+Fp2).ravel()]),
+            np.concatenate([Z(I, K, Fp).ravel(), Y(I2, Fp2, Lp2).ravel()]),
+            np.concatenate([np.ones(r.size), -np.ones(I2.size)]), -inf, 0, [nodes, D, F])
+
+        #Link_Capacity
+        A_, K, S_ = g(ia, ik, i_s, indexing='ij')
+        add('Link_capacity_const', (nA,), A_, X(A_, K, S_), d[K], -inf, data['uu'], [arcs])
+
+    #routing_first_subpath
+    r, c_, v = flow(0)
+    I, K = g(np.arange(nN), ik, indexing='ij')
+    rhs = (I == o[K]).astype(float)
+    add('routing_first_subpath_const', (nN, nD), np.concatenate([r, (I*nD+K).ravel()]),
+        np.concatenate([c_, Z(I, K, chain[K, 0]).ravel()]), np.concatenate([v, np.ones(I.size)]),
+        rhs, rhs, [nodes, D])
+
+    #routing_last_subpath
+    r, c_, v = flow(nb_f-1)
+    rhs = -(I == t[K]).astype(float)
+    add('routing_last_subpath_const', (nN, nD), np.concatenate([r, (I*nD+K).ravel()]),
+        np.concatenate([c_, Z(I, K, chain[K, nb_f-1]).ravel()]), np.concatenate([v, -np.ones(I.size)]),
+        rhs, rhs, [nodes, D])
+
+    #simple_path1: arcs entering i (from a node of N)
+    A_, K, S_ = g(ia, ik, i_s, indexing='ij')
+    keep = tail_in_N[A_]
+    add('simple_path1_const', (nN, nD), (head[A_]*nD+K)[keep], X(A_, K, S_)[keep], 1, -inf, 1, [nodes, D])
+
+    #simple_path2: arcs of A leaving i (i in N)
+    keep = in_A[A_] & head_in_N[A_]
+    rowpos = np.full(nN, -1, dtype=np.int64)
+    rowpos[iN] = np.arange(len(iN))
+    add('simple_path2_const', (len(N), nD), (rowpos[tail[A_]]*nD+K)[keep], X(A_, K, S_)[keep], 1, -inf, 1, [N, D])
+
+    if formulation == 'VNFMultiS':
+        #service_capacity
+        I, Fp, K = g(np.arange(nN), if_, ik, indexing='ij')
+        I2, Fp2, Lp2 = g(np.arange(nN), if_, il, indexing='ij')
+        add('service_capacity_const', (nN, nF),
+            np.concatenate([(I*nF+Fp).ravel(), (I2*nF+Fp2).ravel()]),
+            np.concatenate([Z(I, K, Fp).ravel(), Y(I2, Fp2, Lp2).ravel()]),
+            np.concatenate([d[K].ravel(), -data['mu']*(Lp2+1).ravel()]), -inf, 0, [N, F])
+
+        #single_level
+        add('single_level_const', (nN, nF), I2*nF+Fp2, Y(I2, Fp2, Lp2), 1, -inf, 1, [N, F])
+
+        #node_capacity
+        add('node_capacity_Const', (nN,), I2, Y(I2, Fp2, Lp2), data['mu']*(Lp2+1), -inf, data['nu'], [N])
+    else:
+        #NbVNF
+        if VNFfix is not None:
+            Fp, Lp, I = g(if_, il, iN, indexing='ij')
+            add('NbVNF_const', (nF, nL), Fp*nL+Lp, Y(I, Fp, Lp), 1, -inf, VNFfix, [F, L])
+
+        #Paths2_a
+        A_, K, S_, Fp = g(np.nonzero((head == npos[a]) & tail_in_N)[0], ik, i_s, if_, indexing='ij')
+        K2, Fp2 = g(ik, if_, indexing='ij')
+        add('Paths2a_const', (nD, nF),
+            np.concatenate([(K*nF+Fp).ravel(), (K2*nF+Fp2).ravel()]),
+            np.concatenate([X(A_, K, S_).ravel(), Z(npos[a], K2, Fp2).ravel()]),
+            np.concatenate([np.ones(A_.size), -np.ones(K2.size)]), -inf, 0, [D, F])
+
+    A = sp.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(nrows[0], ncols))
+    A.sum_duplicates()
+    integer = np.ones(ncols, dtype=bool)
+    if formulation == 'VNFHeuristR':
+        integer[:] = False
+    return {
+        'formulation': formulation,
+        'sense': sense,
+        'c': c,
+        'A': A,
+        'row_lb': np.concatenate(lo),
+        'row_ub': np.concatenate(hi),
+        'lb': np.zeros(ncols),
+        'ub': np.ones(ncols),
+        'integer': integer,
+        'rows': blocks,
+        'columns': [('Y', [nodes, F, L], offY),
+                    ('Z', [nodes, D, F], offZ),
+                    ('X', [arcs, D, S1], offX)],
+    }
+
+
+#
+# Names
+#
+
+def _label(name, index):
+    #Pyomo symbolic label, e.g. Y(1_2_3)
+    flat = []
+    for i in index:
+        flat.extend(i if isinstance(i, tuple) else (i,))
+    return '%s(%s)' % (name, '_'.join(str(i) for i in flat))
+
+
+def column_indices(problem):
+    #(variable name, Pyomo index) of every column, in column order
+    for name, sets, offset in problem['columns']:
+        for index in itertools.product(*sets):
+            flat = []
+            for i in index:
+                flat.extend(i if isinstance(i, tuple) else (i,))
+            yield name, tuple(flat)
+
+
+def column_names(problem):
+    return [_label(name, index) for name, index in column_indices(problem)]
+
+
+def row_names(problem):
+    names = []
+    for name, sets, offset, size in problem['rows']:
+        names.extend(_label(name, index) for index in itertools.product(*sets))
+    return names
+
+
+#
+# Output
+#
+
+def write_mps(problem, filename):
+    #Write the problem in free MPS format (read by CPLEX, HiGHS, ...)
+    cnames = column_names(problem)
+    rnames = row_names(problem)
+    lo, hi = problem['row_lb'], problem['row_ub']
+    A = problem['A'].tocsc()
+    with open(filename, 'w') as out:
+        out.write('NAME %s\n' % problem['formulation'])
+        out.write('OBJSENSE\n    %s\n' % ('MIN' if problem['sense'] > 0 else 'MAX'))
+        out.write('ROWS\n N  cost\n')
+        for r, name in enumerate(rnames):
+            if lo[r] == hi[r]:
+                kind = 'E'
+            elif np.isinf(lo[r]):
+                kind = 'L'
+            else:
+                kind = 'G'
+            out.write(' %s  %s\n' % (kind, name))
+        out.write('COLUMNS\n')
+        integer = problem['integer']
+        marker = False
+        for j, name in enumerate(cnames):
+            if integer[j] != marker:
+                out.write("    MARKER  'MARKER'  '%s'\n" % ('INTORG' if integer[j] else 'INTEND'))
+                marker = integer[j]
+            if problem['c'][j] != 0:
+                out.write('    %s  cost  %.17g\n' % (name, problem['c'][j]))
+            for p in range(A.indptr[j], A.indptr[j+1]):
+                out.write('    %s  %s  %.17g\n' % (name, rnames[A.indices[p]], A.data[p]))
+        if marker:
+            out.write("    MARKER  'MARKER'  'INTEND'\n")
+        out.write('RHS\n')
+        for r, name in enumerate(rnames):
+            rhs = lo[r] if np.isinf(hi[r]) else hi[r]
+            if rhs != 0:
+                out.write('    rhs  %s  %.17g\n' % (name, rhs))
+        out.write('RANGES\n')
+        for r, name in enumerate(rnames):
+            if lo[r] != hi[r] and not np.isinf(lo[r]) and not np.isinf(hi[r]):
+                out.write('    rng  %s  %.17g\n' % (name, hi[r]-lo[r]))
+        out.write('BOUNDS\n')
+        for j, name in enumerate(cnames):
+            out.write(' LO bnd  %s  %.17g\n UP bnd  %s  %.17g\n' % (name, problem['lb'][j], name, problem['ub'][j]))
+        out.write('ENDATA\n')
+
+
+#
+# Solve
+#
+
+def solve_matrix(problem, time_limit=None):
+    #Solve the problem with the HiGHS solver shipped with scipy
+    #Return the scipy result, res.x is None if no solution was found
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    options = {}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    res = milp(problem['sense']*problem['c'],
+               constraints=LinearConstraint(problem['A'], problem['row_lb'], problem['row_ub']),
+               integrality=problem['integer'].astype(np.int8),
+               bounds=Bounds(problem['lb'], problem['ub']),
+               options=options)
+    if res.x is not None:
+        res.fun = problem['sense']*res.fun
+    return res
+
+
+def set_cap(problem, VNFfix):
+    #Change the rhs of the NbVNF rows, the matrix is built once for all the caps
+    for name, sets, offset, size in problem['rows']:
+        if name == 'NbVNF_const':
+            problem['row_ub'][offset:offset+size] = VNFfix
+        elif name == 'NbVNF_open_constraint':
+            problem['row_lb'][offset:offset+size] = VNFfix
+            problem['row_ub'][offset:offset+size] = VNFfix
+
+
+def solve_lp(problem, time_limit=None):
+    #Solve the continuous relaxation with scipy.optimize.linprog (HiGHS, in process)
+    #Return the scipy result, res.x is None if no solution was found, otherwise res.fun is the
+    #objective and res.duals the dual value of every row (derivative of the objective with
+    #respect to the rhs of the row), in the sense of the problem
+    from scipy.optimize import linprog
+    A = problem['A']
+    lo, hi = problem['row_lb'], problem['row_ub']
+    eq = lo == hi
+    up = ~eq & np.isfinite(hi)
+    down = ~eq & np.isfinite(lo)
+    options = {}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    res = linprog(problem['sense']*problem['c'],
+                  A_ub=sp.vstack([A[up], -A[down]]).tocsr() if (up.any() or down.any()) else None,
+                  b_ub=np.concatenate([hi[up], -lo[down]]) if (up.any() or down.any()) else None,
+                  A_eq=A[eq] if eq.any() else None,
+                  b_eq=lo[eq] if eq.any() else None,
+                  bounds=np.column_stack([problem['lb'], problem['ub']]),
+                  method='highs', options=options)
+    res.duals = None
+    if res.status != 0:
+        res.x = None
+    if res.x is not None:
+        res.fun = problem['sense']*res.fun
+        duals = np.zeros(len(lo))
+        if eq.any():
+            duals[eq] = res.eqlin.marginals
+        nu = int(up.sum())
+        if nu or down.any():
+            duals[up] += res.ineqlin.marginals[:nu]
+            duals[down] -= res.ineqlin.marginals[nu:]
+        res.duals = problem['sense']*duals
+    return res
+
+
+def row_values(problem, values, name):
+    #{Pyomo index: value} of the rows of the block <name> (e.g. the duals of solve_lp)
+    for block, sets, offset, size in problem['rows']:
+        if block == name:
+            index = [tuple(i for part in idx for i in (part if isinstance(part, tuple) else (part,)))
+                     for idx in itertools.product(*sets)]
+            return dict(zip([i[0] if len(i) == 1 else i for i in index], values[offset:offset+size].tolist()))
+    raise KeyError(name)
+
+
+def load_solution(problem, x, instance):
+    #Copy the values of x in the Y, Z and X variables of a Pyomo instance of the same formulation
+    #the columns missing from the instance (e.g. a presolved instance) are skipped
+    x = np.where(problem['integer'], np.rint(x), x)
+    for j, (name, index) in enumerate(column_indices(problem)):
+        var = getattr(instance, name)
+        if index in var:
+            var[index].set_value(float(x[j]), skip_validation=True)
+
+
+def matrix_from_file(filename, formulation='VNFHeurist', VNFfix=None):
+    #Read a .dat file (through the VNFCache) and build the sparse problem
+    import ModelVNFHeurist2
+    from VNFCache import load_data
+    from VNFUtilities import plain_data
+    builder = getattr(ModelVNFHeurist2, formulation)
+    data = load_data(builder(VNFfix), filename, formulation)
+    return build_matrix(plain_data(data), formulation, VNFfix)
+
+
+def main():
+    # file
+    file = "abilene_s_s_l_l"
+    problem = matrix_from_file(file+".dat", 'VNFHeurist', 5)
+    write_mps(problem, file+".mps")
+    res = solve_matrix(problem, time_limit=120)
+    print("Solver terminated with ", res.message)
+    if res.x is not None:
+        print("objective ", res.fun)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,79 @@
+from pyomo.environ import Var
+from VNFTrace import objective_value
+import numpy as np
+
+
+### Compact solution files ###
+###A solution is written as a compressed .npz file holding, for every variable, only the
+###nonzero entries: <name>_index (one row per entry, one column per index position) and
+###<name>_value, plus the objective. Almost all the X are zero, so the file is a small part of
+###the printPointFromModel dump. np.load reads an array of the file only when it is used.
+###The index layouts are those of the models: Y[i,f,l], Z[i,k,f], X[i,j,k,s].
+
+#position of the nodes and of the demand in the index of every variable
+NODES = {'Y': (0,), 'Z': (0,), 'X': (0, 1)}
+DEMAND = {'Z': 1, 'X': 2}
+WIDTH = {'Y': 3, 'Z': 3, 'X': 4}
+
+
+def write_results(instance, filename, names=('Y','Z','X'), entries=None, tolerance=1e-6):
+    #Write the nonzero values of the variables <names> of the instance (the missing ones are skipped)
+    #entries: {name: {index: value}} values computed outside the instance (e.g. the routes
+    #of SolveVNFBenders), added to those of the instance
+    arrays = {'objective': np.array(np.nan if objective_value(instance) is None else objective_value(instance))}
+    entries = dict(entries or {})
+    for name in names:
+        var = instance.component(name)
+        if isinstance(var, Var):
+            values = dict(entries.get(name, {}))
+            values.update((index, v.value) for index, v in var.items()
+                          if v.value is not None and abs(v.value) > tolerance)
+            entries[name] = values
+    for name, values in entries.items():
+        index = list(values)
+        width = len(index[0]) if index and isinstance(index[0], tuple) else WIDTH.get(name, 1)
+        arrays[name+'_index'] = np.array(index, dtype=np.int64).reshape(len(index), width)
+        arrays[name+'_value'] = np.array([values[i] for i in index], dtype=np.float64)
+    if not filename.endswith('.npz'):
+        filename += '.npz'
+    np.savez_compressed(filename, **arrays)
+    return filename
+
+
+class Results:
+    #Lazy reader of a file written by write_results
+    def __init__(self, filename):
+        self.file = np.load(filename)
+        self.names = sorted(key[:-6] for key in self.file.files if key.endswith('_index'))
+
+    @property
+    def objective(self):
+        value = float(self.file['objective'])
+        return None if np.isnan(value) else value
+
+    def values(self, name, mask=None):
+        #{index: value} of the variable name, restricted to the entries of the mask
+        if name not in self.names:
+            return {}
+        index = self.file[name+'_index']
+        value = self.file[name+'_value']
+        if mask is not None:
+            index, value = index[mask], value[mask]
+        return dict(zip(map(tuple, index.tolist()), value.tolist()))
+
+    def demand(self, k):
+        #{name: {index: value}} of the variables of the demand k (Z and X)
+        return {name: self.values(name, self.file[name+'_index'][:, axis] == k)
+                for name, axis in DEMAND.items() if name in self.names}
+
+    def node(self, i):
+        #{name: {index: value}} of the variables of the node i (Y, Z and the X of the arcs of i)
+        result = {}
+        for name, axes in NODES.items():
+            if name in self.names:
+                index = self.file[name+'_index']
+                result[name] = self.values(name, np.any(index[:, list(axes)] == i, axis=1))
+        return result
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,122 @@
+from pyomo.environ import Objective, value
+from contextlib import contextmanager
+import json
+import os
+import time
+
+
+### Phase timing of the heuristic runs ###
+###Every phase (instance build, bounds, every solve) is written as one JSON line with its
+###duration and the run context (heuristic, file, iteration, VNFfix, ...).
+###A solve through the shell solvers (solver_io='nl') is split in
+### write : _presolve, the .nl file is written
+### solve : _apply_solver, the solver executable runs
+### read  : _postsolve, the .sol file is read
+### load  : the rest of optsolver.solve, the solution is loaded into the instance
+###Solvers without these methods only get the total.
+
+PHASES = (('_presolve', 'write'), ('_apply_solver', 'solve'), ('_postsolve', 'read'))
+
+
+def model_size(instance):
+    return {'variables': instance.nvariables(), 'constraints': instance.nconstraints()}
+
+
+def objective_value(instance):
+    #value of the active objective, None when the instance holds no solution
+    try:
+        return value(next(instance.component_data_objects(Objective, active=True)))
+    except (StopIteration, ValueError):
+        return None
+
+
+def timed_solve(optsolver, instance, solve=None, **kwargs):
+    #solve(optsolver, instance, **kwargs) (optsolver.solve by default), return the results and
+    #the duration of every phase of the solver
+    times = {}
+    wrapped = []
+    for method, phase in PHASES:
+        original = getattr(optsolver, method, None)
+        if original is None:
+            continue
+        def timed(*args, _original=original, _phase=phase, **kw):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kw)
+            finally:
+                times[_phase] = times.get(_phase, 0)+time.perf_counter()-start
+        setattr(optsolver, method, timed)
+        wrapped.append(method)
+    start = time.perf_counter()
+    try:
+        if solve is None:
+            results = optsolver.solve(instance, **kwargs)
+        else:
+            results = solve(optsolver, instance, **kwargs)
+    finally:
+        for method in wrapped:
+            delattr(optsolver, method)
+    times['total'] = time.perf_counter()-start
+    if wrapped:
+        times['load'] = times['total']-sum(times.get(phase, 0) for method, phase in PHASES)
+    return results, times
+
+
+class Trace:
+    #filename None: the phases are timed but nothing is written
+    def __init__(self, filename=None, **context):
+        self.filename = filename
+        self.context = dict(context, run="%s-%d" % (time.strftime('%Y%m%dT%H%M%S'), os.getpid()))
+        self.iteration = 0
+        self.start = time.perf_counter()
+
+    def record(self, phase, **fields):
+        if self.filename is None:
+            return
+        entry = dict(self.context, phase=phase, iteration=self.iteration,
+                     elapsed=time.perf_counter()-self.start)
+        entry.update(fields)
+        #opened for every record: the trace is complete even if the run is killed
+        with open(self.filename, 'a') as out:
+            out.write(json.dumps(entry, default=str)+"\n")
+
+    @contextmanager
+    def phase(self, phase, **fields):
+        #the yielded dict can be completed inside the block (model size, ...)
+        #a block that raises is recorded too, with the exception in 'error'
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields['error'] = repr(e)
+            raise
+        finally:
+            fields['duration'] = time.perf_counter()-start
+            self.record(phase, **fields)
+
+    def solve(self, optsolver, instance, label, solve=None, **fields):
+        #solve and record a 'solve' phase: label (relaxed, integer, ...), objective, status,
+        #model size and the duration of write/solve/read/load
+        start = time.perf_counter()
+        try:
+            results, times = timed_solve(optsolver, instance, solve)
+        except BaseException as e:
+            self.record('solve', label=label, error=repr(e), total=time.perf_counter()-start, **fields)
+            raise
+        if self.filename is None:
+            return results
+        fields.update(model_size(instance))
+        fields.update(times)
+        solver = getattr(results, 'solver', None)
+        self.record('solve', label=label, objective=objective_value(instance),
+                    status=getattr(solver, 'status', None),
+                    termination=getattr(solver, 'termination_condition', None), **fields)
+        return results
+
+
+def open_trace(trace, **context):
+    #trace: None, a file name or a Trace (the context is added to it)
+    if isinstance(trace, Trace):
+        trace.context.update(context)
+        return trace
+    return Trace(trace, **context)
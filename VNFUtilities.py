@@ -0,0 +1,349 @@
+from pyomo.environ import *
+from collections import deque
+import numpy as np
+
+
+### Shared helpers for the VNF formulations ###
+
+
+#
+# Adjacency index
+#
+
+def add_adjacency(model, arcs, nodes, neighbours):
+    #Declare model.<arcs>_out[i] and model.<arcs>_in[i] for every i in <nodes>
+    #Both lists are filled in a single pass over the arcs when the instance is built,
+    #so the routing constraints cost O(degree) instead of O(|N|) membership tests.
+    #Only neighbours belonging to the set <neighbours> are kept (e.g. N without the node a).
+    def build(model):
+        keep = set(getattr(model, neighbours))
+        out_arcs = {i: [] for i in getattr(model, nodes)}
+        in_arcs = {i: [] for i in getattr(model, nodes)}
+        for (i, j) in getattr(model, arcs):
+            if j in keep and i in out_arcs:
+                out_arcs[i].append(j)
+            if i in keep and j in in_arcs:
+                in_arcs[j].append(i)
+        setattr(model, arcs+'_out', out_arcs)
+        setattr(model, arcs+'_in', in_arcs)
+
+    model.add_component(arcs+'_adjacency', BuildAction(rule=build))
+
+
+#
+# Symmetry breaking
+#
+# Two nodes with the same out and in neighbours (the other one aside) that are neither the
+# origin nor the destination of a demand are interchangeable: the capacities are the same on
+# every node, so swapping their Y, Z and routes maps any solution to an equivalent one.
+# Sorting the nodes of every class by total module level keeps one solution of each orbit.
+#
+
+def twin_classes(nodes, out_arcs, in_arcs, endpoints):
+    #Classes (lists of at least two nodes) of interchangeable nodes, disjoint
+    #non adjacent twins share their neighbours, adjacent twins their neighbours and themselves
+    classes = {}
+    for i in nodes:
+        if i not in endpoints:
+            classes.setdefault((frozenset(out_arcs[i]), frozenset(in_arcs[i])), []).append(i)
+    result = [c for c in classes.values() if len(c) > 1]
+    closed = {}
+    for c in classes.values():
+        if len(c) == 1:
+            i = c[0]
+            closed.setdefault((frozenset(out_arcs[i]) | {i}, frozenset(in_arcs[i]) | {i}), []).append(i)
+    result += [c for c in closed.values() if len(c) > 1]
+    return [sorted(c) for c in result]
+
+
+def add_symmetry_breaking(model, levels='L', level=None):
+    #Declare model.symmetry_const: sum(l*Y[i,f,l]) >= sum(l*Y[j,f,l]) for consecutive nodes
+    #i < j of every class of twins (add_adjacency(model,'A',...) must be declared before)
+    #levels: name of the set of module levels indexing Y
+    #level: level(model,i,f) module level of f on i when it is not encoded by Y (LEVEL_ENCODINGS)
+    def build(model):
+        endpoints = set(model.o[k] for k in model.D) | set(model.t[k] for k in model.D)
+        model.twin_classes = twin_classes(model.N, model.A_out, model.A_in, endpoints)
+
+    model.symmetry_build = BuildAction(rule=build)
+    model.twin_pairs = Set(dimen=2, initialize=lambda model: [(c[p], c[p+1]) for c in model.twin_classes for p in range(len(c)-1)])
+
+    def order(model, i, j):
+        if level is not None:
+            return sum(level(model,i,f) for f in model.F) >= sum(level(model,j,f) for f in model.F)
+        L = getattr(model, levels)
+        return sum(l*model.Y[i,f,l] for f in model.F for l in L) >= sum(l*model.Y[j,f,l] for f in model.F for l in L)
+
+    model.symmetry_const = Constraint(model.twin_pairs, rule=order)
+
+
+#
+# Module levels
+#
+# The module level of a function on a node is encoded (VNFMultiS of ModelVNFMultiS1) by
+# 'unary'  : Y[i,f,l] = 1 if f is installed on i at level l, at most one l (single_level_const)
+# 'integer': O[i,f] = 1 if f is installed on i, V[i,f] its level (general integer in [0,nb_m])
+# 'binary' : O[i,f] and the bits B[i,f,b] of the level (b in Bits)
+# The compact encodings are read and written through the levels {(i,f): l} of the open instances,
+# and reported in the Y layout (level_entries).
+#
+
+LEVEL_ENCODINGS = ('unary', 'integer', 'binary')
+LEVEL_VARIABLES = {'unary': ('Y',), 'integer': ('O','V'), 'binary': ('O','B')}
+
+
+def level_encoding(instance):
+    if instance.component('Y') is not None:
+        return 'unary'
+    return 'integer' if instance.component('V') is not None else 'binary'
+
+
+def module_levels(instance):
+    #{(i,f): l} module level of every open instance
+    encoding = level_encoding(instance)
+    if encoding == 'unary':
+        return {(i, f): l for (i, f, l), var in instance.Y.items() if var.value is not None and var.value > 0.5}
+    levels = {}
+    for (i, f), var in instance.O.items():
+        if var.value is None or var.value < 0.5:
+            continue
+        if encoding == 'integer':
+            levels[i, f] = int(round(instance.V[i,f].value))
+        else:
+            levels[i, f] = sum(2**b for b in instance.Bits if instance.B[i,f,b].value > 0.5)
+    return levels
+
+
+def set_module_levels(instance, levels):
+    #Set the variables encoding the levels to {(i,f): l} (MIP start), the other instances are closed
+    encoding = level_encoding(instance)
+    if encoding == 'unary':
+        for (i, f, l), var in instance.Y.items():
+            var.set_value(float(levels.get((i, f), 0) == l), skip_validation=True)
+        return
+    for (i, f), var in instance.O.items():
+        l = levels.get((i, f), 0)
+        var.set_value(float(l > 0), skip_validation=True)
+        if encoding == 'integer':
+            instance.V[i,f].set_value(float(l), skip_validation=True)
+        else:
+            for b in instance.Bits:
+                instance.B[i,f,b].set_value(float((l >> b) & 1), skip_validation=True)
+
+
+def level_entries(instance):
+    #the levels in the Y layout {(i,f,l): 1.0} (entries of VNFResults.write_results)
+    return {(i, f, l): 1.0 for (i, f), l in module_levels(instance).items()}
+
+
+#
+# Data
+#
+
+def plain_data(data):
+    #Convert the data of a .dat file (format of DataPortal.data() / VNFCache.load_data)
+    #into plain python values: scalars, lists for the sets and dicts for the indexed params
+    if None in data:
+        data = data[None]
+    values = {}
+    for name, value in data.items():
+        if isinstance(value, dict) and list(value) == [None]:
+            values[name] = value[None]
+        else:
+            values[name] = dict(value)
+    return values
+
+
+#
+# Warm start
+#
+
+def copy_values(source, target, names=('Y','Z','X'), rounding=False):
+    #Copy the values of the variables <names> of source into target (same index sets)
+    #rounding=True rounds the values of a relaxed solution to 0/1
+    for name in names:
+        target_var = getattr(target, name)
+        for index, var in getattr(source, name).items():
+            value = var.value
+            if value is None or index not in target_var:
+                continue
+            if rounding:
+                value = float(value >= 0.5)
+            target_var[index].set_value(value, skip_validation=True)
+
+
+def save_values(instance, names=('Y','Z','X')):
+    #Snapshot of the values of the variables <names>, restored with load_values
+    return {name: {index: var.value for index, var in getattr(instance, name).items()} for name in names}
+
+
+def load_values(instance, values):
+    for name, saved in values.items():
+        var = getattr(instance, name)
+        for index, value in saved.items():
+            var[index].set_value(value, skip_validation=True)
+
+
+def set_relaxed(instance, relaxed, names=('Y','Z','X')):
+    #Switch the variables <names> between [0,1] (relaxed=True, as VNFHeuristR) and Binary in place
+    #Return the variable data changed (to be sent to a persistent solver with push_vars)
+    changed = []
+    for name in names:
+        for var in getattr(instance, name).values():
+            if relaxed and var.is_integer():
+                var.domain = PositiveReals
+                var.setlb(0)
+                var.setub(1)
+            elif not relaxed and not var.is_integer():
+                var.domain = Binary
+            else:
+                continue
+            changed.append(var)
+    return changed
+
+
+def round_values(instance, names=('Y','Z','X')):
+    #Round the values of a relaxed solution to 0/1 in place (MIP start of the integer solve)
+    copy_values(instance, instance, names, rounding=True)
+
+
+#
+# Variable blocks as arrays
+#
+# A VarBlock reads all the values of an indexed variable (Y, Z, X) into one numpy array and
+# fixes or unfixes its entries by boolean mask. The entries keep the order of the variable,
+# index[p] is the index of the entry p (one column per index position).
+#
+
+class VarBlock:
+
+    def __init__(self, var):
+        self.var = var
+        self.datas = list(var.values())
+        self.index = np.array(list(var.keys()), dtype=np.int64).reshape(len(self.datas), -1)
+
+    def values(self):
+        #values of the entries, nan when a variable has no value
+        return np.fromiter((np.nan if v.value is None else v.value for v in self.datas), dtype=float, count=len(self.datas))
+
+    def fixed(self):
+        return np.fromiter((v.fixed for v in self.datas), dtype=bool, count=len(self.datas))
+
+    def select(self, mask):
+        #variable data of the entries of the mask
+        return [self.datas[p] for p in np.flatnonzero(mask)]
+
+    def set_values(self, values, mask=None):
+        for p in np.flatnonzero(mask) if mask is not None else range(len(self.datas)):
+            self.datas[p].set_value(float(values[p]), skip_validation=True)
+
+    def fix(self, mask, values=None):
+        #fix the entries of the mask at values (their current values if None), return the variable
+        #data fixed (to be sent to a persistent solver with push_vars)
+        selected = self.select(mask)
+        for p, v in zip(np.flatnonzero(mask), selected):
+            v.fix(v.value if values is None else float(values[p]))
+        return selected
+
+    def unfix(self, mask):
+        selected = self.select(mask)
+        for v in selected:
+            v.unfix()
+        return selected
+
+
+def solve_warm(optsolver, instance, **kwargs):
+    #Solve the instance using the current values of its variables as a MIP start
+    #Solvers with a warm start interface get warmstart=True. With solver_io='nl' the
+    #values are written as initial guesses in the .nl file, cplexamp uses them as MIP start.
+    if optsolver.warm_start_capable():
+        kwargs['warmstart'] = True
+    return optsolver.solve(instance, **kwargs)
+
+
+#
+# Persistent solvers
+#
+# A persistent solver (create_solver(persistent=True), e.g. cplex_persistent) keeps the
+# instance loaded between the solves. It does not follow the changes made to the instance:
+# fixed variables and rows depending on a mutable Param (NbVNF_const and VNFfix) have to be
+# pushed. With the other solvers these helpers do nothing, the instance is written at each solve.
+#
+
+def is_persistent(optsolver):
+    return hasattr(optsolver, 'set_instance') and hasattr(optsolver, 'update_var')
+
+
+def attach_instance(optsolver, instance):
+    #load the instance in a persistent solver
+    if is_persistent(optsolver):
+        optsolver.set_instance(instance)
+
+
+def push_vars(optsolver, variables):
+    #send the bounds and the fixed state of the variables
+    if is_persistent(optsolver):
+        for var in variables:
+            optsolver.update_var(var)
+
+
+def push_constraints(optsolver, constraints, added=False):
+    #send rows whose rhs changed (removed and added again), or rows added to the instance
+    #constraints: an indexed Constraint or an iterable of constraint data
+    if not is_persistent(optsolver):
+        return
+    if hasattr(constraints, 'values'):
+        constraints = constraints.values()
+    for con in constraints:
+        if not added:
+            optsolver.remove_constraint(con)
+        optsolver.add_constraint(con)
+
+
+#
+# Paths
+#
+
+def shortest_path(out_arcs, o, t, blocked_arcs=(), blocked_nodes=()):
+    #BFS path (list of nodes) from o to t avoiding the given arcs and nodes, None if t cannot be reached
+    prev = {o: None}
+    todo = deque([o])
+    while todo:
+        i = todo.popleft()
+        if i == t:
+            path = [t]
+            while prev[path[-1]] is not None:
+                path.append(prev[path[-1]])
+            return path[::-1]
+        for j in out_arcs[i]:
+            if j not in prev and j not in blocked_nodes and (i, j) not in blocked_arcs:
+                prev[j] = i
+                todo.append(j)
+    return None
+
+
+def k_shortest_paths(out_arcs, o, t, k, blocked_arcs=()):
+    #Yen's algorithm: at most k simple paths from o to t by increasing number of hops
+    path = shortest_path(out_arcs, o, t, blocked_arcs)
+    if path is None:
+        return []
+    paths = [path]
+    candidates = []
+    while len(paths) < k:
+        last = paths[-1]
+        for n in range(len(last)-1):
+            root = last[:n+1]
+            removed = set(blocked_arcs)
+            for p in paths:
+                if p[:n+1] == root:
+                    removed.add((p[n], p[n+1]))
+            spur = shortest_path(out_arcs, root[-1], t, removed, set(root[:-1]))
+            if spur is not None:
+                candidate = root[:-1]+spur
+                if candidate not in candidates and candidate not in paths:
+                    candidates.append(candidate)
+        if not candidates:
+            break
+        candidates.sort(key=len)
+        paths.append(candidates.pop(0))
+    return paths
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+#the modules are flat scripts at the root of the repository
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.abspath(os.path.join(ROOT, '../utilities')))
+
+SMALL = os.path.join(os.path.dirname(__file__), 'small.dat')
+
+
+@pytest.fixture
+def small_file():
+    #6 nodes on a ring with 2 chords, 4 demands, 3 functions, 2 module levels
+    return SMALL
+
+
+@pytest.fixture
+def small_data(tmp_path):
+    #plain data of small.dat (VNFUtilities.plain_data)
+    from ModelVNFMultiS1 import VNFMultiS
+    from VNFCache import load_data
+    from VNFUtilities import plain_data
+    return plain_data(load_data(VNFMultiS(), SMALL, 'VNFMultiS', cache_dir=str(tmp_path)))
@@ -0,0 +1,38 @@
+import pytest
+
+from VNFBounds import HeuristBound, LowerBounds, LPBound, max_level
+from VNFGreedy import GreedyPlacement
+from VNFMatrix import build_matrix, solve_matrix
+
+
+def serves_every_demand(data, cap):
+    res = solve_matrix(build_matrix(data, 'VNFHeurist', cap))
+    return res.x is not None and res.fun >= data['nb_d']*len(data['F'])-1e-6
+
+
+def test_lower_bounds(small_data):
+    data = small_data
+    bounds = LowerBounds(data)
+    assert bounds['feasible']
+    greedy = GreedyPlacement(data)
+    assert bounds['objective'] <= greedy['objective']
+    lp = LPBound(data)
+    assert lp is not None and bounds['objective'] <= lp['objective'] <= greedy['objective']
+
+
+def test_lower_bounds_infeasible(small_data):
+    data = dict(small_data)
+    data['d'] = dict(data['d'])
+    data['d'][1] = data['mu']*max_level(data)+1
+    assert not LowerBounds(data)['feasible']
+
+
+#(uu, nb_m, bound): with uu=2 no demand fits on an arc, the first and last functions
+#are located on the origins and destinations
+@pytest.mark.parametrize('uu, nb_m, bound', [(30, 2, 1), (2, 2, 2), (2, 1, 3)])
+def test_heurist_bound(small_data, uu, nb_m, bound):
+    data = dict(small_data, uu=uu, nb_m=nb_m)
+    assert HeuristBound(data) == bound
+    assert serves_every_demand(data, bound)
+    if bound > 1:
+        assert not serves_every_demand(data, bound-1)
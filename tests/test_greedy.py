@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from VNFBounds import max_level
+from VNFGreedy import GreedyPlacement, route_placement
+from VNFMatrix import build_matrix, column_indices
+
+
+@pytest.mark.parametrize('last_on_destination', [False, True])
+def test_greedy_placement_is_feasible(small_data, last_on_destination):
+    data = small_data
+    greedy = GreedyPlacement(data, last_on_destination)
+    assert greedy['feasible']
+    assert set(greedy['routes']) == set(range(1, data['nb_d']+1))
+
+    load = {}
+    served = {}
+    for k, route in greedy['routes'].items():
+        assert (route[0], route[-1]) == (data['o'][k], data['t'][k])
+        assert len(set(route)) == len(route)
+        for arc in zip(route, route[1:]):
+            assert arc in data['A']
+            load[arc] = load.get(arc, 0)+data['d'][k]
+        #the functions of the chain are served in order along the route
+        positions = [route.index(greedy['assign'][k, data['f'][k, s]]) for s in range(1, data['nb_f']+1)]
+        assert positions == sorted(positions)
+        for s in range(1, data['nb_f']+1):
+            key = (greedy['assign'][k, data['f'][k, s]], data['f'][k, s])
+            served[key] = served.get(key, 0)+data['d'][k]
+    assert max(load.values()) <= data['uu']
+
+    for (i, f), d in served.items():
+        assert d <= data['mu']*greedy['level'][i, f]
+    for i in range(1, data['nb_n']+1):
+        assert sum(data['mu']*l for (j, f), l in greedy['level'].items() if j == i) <= data['nu']
+    assert greedy['objective'] == sum(greedy['level'].values())
+    assert max(greedy['level'].values()) <= max_level(data)
+
+
+def test_greedy_placement_in_vnfmultis(small_data):
+    #the routing rows of VNFMultiS put the last two functions of a chain on the destination
+    data = small_data
+    assert route_placement(data, GreedyPlacement(data)) is None
+    greedy = GreedyPlacement(data, last_on_destination=True)
+    for k in range(1, data['nb_d']+1):
+        for s in (data['nb_f']-1, data['nb_f']):
+            assert greedy['assign'][k, data['f'][k, s]] == data['t'][k]
+    routing = route_placement(data, greedy)
+    assert routing is not None
+
+    #the placement and its routing satisfy every row of VNFMultiS
+    problem = build_matrix(data, 'VNFMultiS')
+    x = np.zeros(len(problem['c']))
+    for j, (name, index) in enumerate(column_indices(problem)):
+        if name == 'Y':
+            x[j] = greedy['level'].get(index[:2]) == index[2]
+        elif name == 'Z':
+            x[j] = greedy['assign'].get(index[1:]) == index[0]
+        else:
+            x[j] = routing['X'][index]
+    rows = problem['A'] @ x
+    assert (rows >= problem['row_lb']-1e-6).all() and (rows <= problem['row_ub']+1e-6).all()
+    assert problem['c'] @ x == greedy['objective']
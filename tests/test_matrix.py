@@ -0,0 +1,60 @@
+import pytest
+from pyomo.environ import Constraint, Var, value
+from pyomo.repn import generate_standard_repn
+
+import ModelVNFHeurist2
+import ModelVNFMultiS1
+from VNFCache import load_data
+from VNFMatrix import build_matrix, column_indices, row_names
+from VNFUtilities import plain_data
+
+
+#(builder, formulation of build_matrix, cap), the cap None drops NbVNF (ModelVNFMultiS1)
+FORMULATIONS = [
+    (ModelVNFHeurist2.VNFHeurist, 'VNFHeurist', 2),
+    (ModelVNFHeurist2.VNFMultiS, 'VNFMultiS', 1),
+    (ModelVNFMultiS1.VNFMultiS, 'VNFMultiS', None),
+]
+
+
+def pyomo_label(constraint):
+    #label of row_names, e.g. Link_capacity_const(1_2)
+    index = constraint.index()
+    index = index if isinstance(index, tuple) else (index,)
+    return '%s(%s)' % (constraint.parent_component().name, '_'.join(str(i) for i in index))
+
+
+@pytest.mark.parametrize('builder, formulation, cap', FORMULATIONS)
+def test_build_matrix_matches_pyomo_rows(builder, formulation, cap, small_file, tmp_path):
+    model = builder() if cap is None else builder(cap)
+    data = load_data(model, small_file, formulation, cache_dir=str(tmp_path))
+    instance = model.create_instance(data)
+    problem = build_matrix(plain_data(data), formulation, cap)
+
+    columns = [id(getattr(instance, name)[index]) for name, index in column_indices(problem)]
+    assert len(set(columns)) == len(list(instance.component_data_objects(Var)))
+    constraints = list(instance.component_data_objects(Constraint, active=True))
+    assert row_names(problem) == [pyomo_label(c) for c in constraints]
+
+    A = problem['A'].tocsr()
+    for r, c in enumerate(constraints):
+        repn = generate_standard_repn(c.body)
+        expected = {}
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            expected[id(var)] = expected.get(id(var), 0)+coef
+        expected = {key: coef for key, coef in expected.items() if coef != 0}
+        row = {columns[j]: a for j, a in zip(A.indices[A.indptr[r]:A.indptr[r+1]], A.data[A.indptr[r]:A.indptr[r+1]]) if a != 0}
+        lower = (-float('inf') if c.lower is None else value(c.lower))-repn.constant
+        upper = (float('inf') if c.upper is None else value(c.upper))-repn.constant
+        lo, hi = problem['row_lb'][r], problem['row_ub'][r]
+        #a row may be stored with the opposite sign
+        same = row == pytest.approx(expected) and (lo, hi) == pytest.approx((lower, upper))
+        opposite = {key: -a for key, a in row.items()} == pytest.approx(expected) and (-hi, -lo) == pytest.approx((lower, upper))
+        assert same or opposite, pyomo_label(c)
+
+
+def test_build_matrix_columns(small_data):
+    problem = build_matrix(small_data, 'VNFHeurist', 2)
+    assert problem['A'].shape[1] == len(problem['c']) == len(problem['lb']) == len(problem['ub'])
+    assert problem['integer'].all()
+    assert not build_matrix(small_data, 'VNFHeuristR', 2)['integer'].any()
@@ -0,0 +1,39 @@
+import pytest
+from pyomo.environ import SolverFactory, value
+
+from ModelVNFPath import MAX_PATHS, VNFMultiSPath, placements
+from VNFCache import load_data
+from VNFMatrix import build_matrix, solve_matrix
+from VNFUtilities import k_shortest_paths
+
+
+def test_k_shortest_paths():
+    #two routes of 2 hops and one of 3 hops from 1 to 4
+    out_arcs = {1: [2, 3, 5], 2: [4], 3: [4], 4: [], 5: [6], 6: [4]}
+    paths = k_shortest_paths(out_arcs, 1, 4, 5)
+    assert sorted(paths[:2]) == [[1, 2, 4], [1, 3, 4]]
+    assert paths[2:] == [[1, 5, 6, 4]]
+    assert k_shortest_paths(out_arcs, 1, 4, 2) == paths[:2]
+    assert k_shortest_paths(out_arcs, 1, 4, 5, blocked_arcs={(1, 2), (1, 3)}) == [[1, 5, 6, 4]]
+    assert k_shortest_paths(out_arcs, 4, 1, 3) == []
+
+
+def test_placements():
+    route = [1, 2, 3]
+    assert len(list(placements(route, [1, 2, 3]))) == 10
+    #the last two functions on the destination, the first one anywhere
+    assert [p for r, p in placements(route, [1, 2, 3], True)] == [(0, 2, 2), (1, 2, 2), (2, 2, 2)]
+
+
+def test_path_and_arc_optima(small_data, small_file, tmp_path):
+    solver = SolverFactory('appsi_highs')
+    if not solver.available(exception_flag=False):
+        pytest.skip('HiGHS is not available')
+    arc = solve_matrix(build_matrix(small_data, 'VNFMultiS'))
+    assert arc.status == 0
+
+    model = VNFMultiSPath()
+    instance = model.create_instance(load_data(model, small_file, 'VNFMultiSPath', cache_dir=str(tmp_path)))
+    assert all(len(instance.demand_paths[k]) <= MAX_PATHS for k in instance.D)
+    solver.solve(instance)
+    assert value(instance.cost) == pytest.approx(arc.fun)
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from VNFTrace import Trace
+
+
+class FailingSolver:
+    def solve(self, instance, **kwargs):
+        raise RuntimeError("solver crashed")
+
+
+def read(filename):
+    with open(filename) as lines:
+        return [json.loads(line) for line in lines]
+
+
+def test_phase_is_recorded(tmp_path):
+    trace = Trace(str(tmp_path/'trace.jsonl'), heuristic='test')
+    with trace.phase('build', VNFfix=2) as rec:
+        rec.update(variables=10)
+    [entry] = read(trace.filename)
+    assert (entry['phase'], entry['VNFfix'], entry['variables'], entry['heuristic']) == ('build', 2, 10, 'test')
+    assert entry['duration'] >= 0 and 'error' not in entry
+
+
+def test_failed_phase_is_recorded(tmp_path):
+    trace = Trace(str(tmp_path/'trace.jsonl'))
+    with pytest.raises(RuntimeError):
+        with trace.phase('lagrangian', VNFfix=3):
+            raise RuntimeError("no time left")
+    [entry] = read(trace.filename)
+    assert entry['phase'] == 'lagrangian' and 'no time left' in entry['error']
+    assert entry['duration'] >= 0
+
+
+def test_failed_solve_is_recorded(tmp_path):
+    trace = Trace(str(tmp_path/'trace.jsonl'))
+    with pytest.raises(RuntimeError):
+        trace.solve(FailingSolver(), None, 'integer', VNFfix=1)
+    [entry] = read(trace.filename)
+    assert (entry['phase'], entry['label'], entry['VNFfix']) == ('solve', 'integer', 1)
+    assert 'solver crashed' in entry['error']